@@ -97,6 +97,31 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared by every web worker and the job runner: playlist and autocomplete
+# versions and cached course access are only invalidated correctly if all
+# processes see the same cache, so REDIS_URL is required for any deployment
+# with more than one process (several gunicorn workers, or the web server
+# plus `run_jobs`, as in the Procfile). Without it each process keeps its
+# own in-memory cache, which is only right for a single process, e.g.
+# runserver with JOBS_RUN_IMMEDIATELY.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -154,4 +179,105 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Video delivery
+# 'python' streams files through the Django worker. 'nginx' returns an
+# X-Accel-Redirect to VIDEO_ACCEL_REDIRECT_PREFIX, which must be an
+# `internal` location aliased to MEDIA_ROOT, e.g.
+#     location /protected-media/ { internal; alias /path/to/media/; }
+# 'sendfile' returns an X-Sendfile header for Apache/lighttpd.
+VIDEO_DELIVERY_BACKEND = os.environ.get('VIDEO_DELIVERY_BACKEND', 'python')
+VIDEO_ACCEL_REDIRECT_PREFIX = os.environ.get('VIDEO_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# Read size for in-process streaming when the server has no sendfile support
+VIDEO_STREAM_CHUNK_SIZE = int(os.environ.get('VIDEO_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Cache-Control max-age (seconds) for authorized video and thumbnail
+# responses. Once it expires the browser revalidates with
+# If-None-Match/If-Modified-Since and gets a 304 if nothing changed.
+VIDEO_CACHE_MAX_AGE = int(os.environ.get('VIDEO_CACHE_MAX_AGE', 24 * 60 * 60))
+THUMBNAIL_CACHE_MAX_AGE = int(os.environ.get('THUMBNAIL_CACHE_MAX_AGE', 24 * 60 * 60))
+
+# Lifetime (seconds) of the signed stream URLs issued by watch_video. Kept
+# short because a URL stays valid after access is revoked; the watch page
+# fetches a fresh one from video_stream_url when playback hits an expired URL.
+VIDEO_STREAM_URL_MAX_AGE = int(os.environ.get('VIDEO_STREAM_URL_MAX_AGE', 5 * 60))
+
+# Threads reading video files for async (ASGI) streaming
+VIDEO_ASYNC_READ_WORKERS = int(os.environ.get('VIDEO_ASYNC_READ_WORKERS', 16))
+
+# Cache of hot video blocks (the first and last VIDEO_BLOCK_CACHE_HOT_BYTES
+# of each file). 'local' keeps an LRU of up to VIDEO_BLOCK_CACHE_MAX_BYTES in
+# each worker process; 'django' stores blocks in the VIDEO_BLOCK_CACHE_ALIAS
+# cache so workers share them; '' disables the cache.
+VIDEO_BLOCK_CACHE_BACKEND = os.environ.get('VIDEO_BLOCK_CACHE_BACKEND', 'local')
+VIDEO_BLOCK_CACHE_MAX_BYTES = int(os.environ.get('VIDEO_BLOCK_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+VIDEO_BLOCK_CACHE_BLOCK_SIZE = 256 * 1024
+VIDEO_BLOCK_CACHE_HOT_BYTES = 4 * 1024 * 1024
+VIDEO_BLOCK_CACHE_ALIAS = 'default'
+VIDEO_BLOCK_CACHE_TIMEOUT = 60 * 60
+
+# Optional ingest stage that splits uploads into fMP4 segments with an HLS
+# playlist (MEDIA_ROOT/segments/<video id>/), run as a background job
+VIDEO_SEGMENTING = os.environ.get('VIDEO_SEGMENTING', 'False') == 'True'
+VIDEO_SEGMENT_DURATION = 6  # target seconds per segment
+
+# Courses per dashboard list page (keyset-paginated on id)
+DASHBOARD_PAGE_SIZE = 24
+
+# Most relevant matches returned by the dashboard's full-text course search
+COURSE_SEARCH_LIMIT = 200
+
+# Dashboard search suggestions: how many to return, and how many prefixes
+# each process keeps cached results for. A process that falls more than
+# AUTOCOMPLETE_MAX_CHANGES course changes behind rebuilds its index from
+# the Course table instead of applying them one by one.
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_RESULT_CACHE_SIZE = 1024
+AUTOCOMPLETE_MAX_CHANGES = 500
+
+# Lifetime (seconds) of cached course playlists. Changes to a course's
+# videos invalidate its playlist straight away; this only bounds staleness
+# after changes made outside Django (e.g. raw SQL). Invalidation reaches
+# other worker processes only through the shared cache in CACHES.
+PLAYLIST_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Lifetime (seconds) of each user's cached set of viewable/manageable course
+# ids. Enrollment and course changes invalidate it straight away, in every
+# worker process as long as CACHES is shared.
+ACCESS_CACHE_TIMEOUT = 5 * 60
+
+# Resumable video uploads (course/<id>/uploads/). Chunks are streamed from
+# the request straight onto the video's final file, VIDEO_UPLOAD_READ_SIZE
+# bytes at a time. VIDEO_UPLOAD_LEASE (seconds) is how long a stalled chunk
+# request keeps other requests from writing to the same upload.
+VIDEO_UPLOAD_MAX_SIZE = int(os.environ.get('VIDEO_UPLOAD_MAX_SIZE', 10 * 1024 ** 3))
+VIDEO_UPLOAD_MAX_CHUNK = 64 * 1024 * 1024
+VIDEO_UPLOAD_READ_SIZE = 64 * 1024
+VIDEO_UPLOAD_LEASE = 5 * 60
+
+# Background jobs (post-upload processing) are stored in the database and
+# run by `python manage.py run_jobs` on JOB_WORKERS threads. A failed job is
+# retried after JOB_RETRY_DELAY seconds, doubling each time, up to
+# JOB_MAX_ATTEMPTS runs. The runner renews the lease of the jobs it is
+# running every JOB_HEARTBEAT_INTERVAL seconds; a job whose lease of
+# JOB_LEASE seconds runs out is assumed to have lost its worker and is
+# picked up again. Nothing starts the runner for you: run it as its own
+# process next to the web server (see README.md), or set
+# JOBS_RUN_IMMEDIATELY to run jobs in the request once it commits (handy
+# for development without a runner; those jobs get no heartbeat).
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_LEASE = 30 * 60
+JOB_HEARTBEAT_INTERVAL = 60
+JOBS_RUN_IMMEDIATELY = os.environ.get('JOBS_RUN_IMMEDIATELY', 'False') == 'True'
+
+# Uploaded videos are stored once per distinct content under their SHA-256
+# (LibraryApp/storage.py). Large uploads are hashed while they are spooled
+# to disk; small ones, kept in memory, are hashed when saved.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'LibraryApp.storage.HashingFileUploadHandler',
+]
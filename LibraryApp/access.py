@@ -0,0 +1,137 @@
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Course, Enrollment
+
+
+class CourseAccess(namedtuple('CourseAccess', 'taught enrolled')):
+    """
+    The ids of the courses a user teaches and is enrolled in
+    """
+    __slots__ = ()
+
+    def can_view(self, course_id):
+        """
+        Enrolled students and the instructor may watch a course
+        """
+        return course_id in self.taught or course_id in self.enrolled
+
+    def can_manage(self, course_id):
+        """
+        Only the instructor may edit a course and its videos
+        """
+        return course_id in self.taught
+
+
+NO_ACCESS = CourseAccess(frozenset(), frozenset())
+
+
+def _version_key(user_id):
+    return f'access:version:{user_id}'
+
+
+def _cache_key(user_id, version):
+    return f'access:{user_id}:{version}'
+
+
+def _current_version(user_id):
+    """
+    The user's access version in the shared cache, restarting from the
+    clock when it was evicted (see playlist._current_version)
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+async def _acurrent_version(user_id):
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        await cache.aadd(_version_key(user_id), time.time_ns(), None)
+        version = await cache.aget(_version_key(user_id))
+    return version
+
+
+def _load_access(user_id):
+    return CourseAccess(
+        frozenset(Course.objects.filter(instructor_id=user_id).values_list('id', flat=True)),
+        frozenset(Enrollment.objects.filter(user_id=user_id).values_list('course_id', flat=True)),
+    )
+
+
+async def _aload_access(user_id):
+    taught = Course.objects.filter(instructor_id=user_id).values_list('id', flat=True)
+    enrolled = Enrollment.objects.filter(user_id=user_id).values_list('course_id', flat=True)
+    return CourseAccess(
+        frozenset([course_id async for course_id in taught]),
+        frozenset([course_id async for course_id in enrolled]),
+    )
+
+
+def course_access(request):
+    """
+    CourseAccess for request.user, memoized on the request and kept for
+    ACCESS_CACHE_TIMEOUT seconds in the Django cache. Enrollment and course
+    signals invalidate the cached entry.
+
+    Entries are stored under the user's current version number, as
+    playlists are: a request that loaded the ids before an enrollment
+    committed writes them under the old version, where no later request
+    looks. CACHES must be shared by all worker processes for invalidation
+    to reach them.
+    """
+    access = getattr(request, '_course_access', None)
+    if access is None:
+        user = request.user
+        if not user.is_authenticated:
+            access = NO_ACCESS
+        else:
+            key = _cache_key(user.id, _current_version(user.id))
+            access = cache.get(key)
+            if access is None:
+                access = _load_access(user.id)
+                cache.set(key, access, settings.ACCESS_CACHE_TIMEOUT)
+        request._course_access = access
+    return access
+
+
+async def acourse_access(request):
+    """
+    Async variant of course_access for async views
+    """
+    access = getattr(request, '_course_access', None)
+    if access is None:
+        user = await request.auser()
+        if not user.is_authenticated:
+            access = NO_ACCESS
+        else:
+            key = _cache_key(user.id, await _acurrent_version(user.id))
+            access = await cache.aget(key)
+            if access is None:
+                access = await _aload_access(user.id)
+                await cache.aset(key, access, settings.ACCESS_CACHE_TIMEOUT)
+        request._course_access = access
+    return access
+
+
+def _bump_version(user_id):
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        _current_version(user_id)
+
+
+def invalidate_course_access(user_id, request=None):
+    """
+    Forget a user's cached access once the current transaction commits,
+    and drop the memoized copy on `request` straight away
+    """
+    if request is not None:
+        request.__dict__.pop('_course_access', None)
+    transaction.on_commit(lambda: _bump_version(user_id))
@@ -0,0 +1,254 @@
+import bisect
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Course
+
+VERSION_CACHE_KEY = 'autocomplete:version'
+CHANGE_CACHE_KEY = 'autocomplete:change:{}'
+CHANGE_CACHE_TIMEOUT = 24 * 60 * 60
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+class PrefixIndex:
+    """
+    In-memory prefix index of course titles and instructor names.
+
+    Every label is stored under each of its word-suffixes ("intro to python"
+    is found by "intro", "to p" and "pyth") in a sorted list, so a lookup is
+    a binary search plus a short scan. Results are kept in a small per-prefix
+    LRU that is emptied whenever the index changes.
+
+    Model signals publish each committed change to the shared Django cache:
+    the version is bumped and the ids of the changed courses are stored
+    under the new version. Every process (this one included) catches up by
+    reloading just those courses. It only rebuilds the whole index from the
+    Course table on its first lookup, when a change record is missing
+    (evicted), or when it is more than AUTOCOMPLETE_MAX_CHANGES versions
+    behind.
+    """
+
+    def __init__(self, result_cache_size):
+        self.result_cache_size = result_cache_size
+        self.version = None
+        self._keys = []
+        self._entries = []
+        self._courses = {}
+        self._label_counts = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _label_entries(label, kind):
+        words = normalize(label).split()
+        return [(' '.join(words[start:]), start, label, kind) for start in range(len(words))]
+
+    def _insert(self, label, kind):
+        count = self._label_counts.get((label, kind), 0)
+        self._label_counts[(label, kind)] = count + 1
+        if count:
+            return
+        for entry in self._label_entries(label, kind):
+            position = bisect.bisect_left(self._entries, entry)
+            self._entries.insert(position, entry)
+            self._keys.insert(position, entry[0])
+
+    def _remove(self, label, kind):
+        count = self._label_counts.get((label, kind), 0)
+        if count > 1:
+            self._label_counts[(label, kind)] = count - 1
+            return
+        self._label_counts.pop((label, kind), None)
+        for entry in self._label_entries(label, kind):
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+                del self._keys[position]
+
+    def _add_course(self, course_id, title, instructor_id, instructor):
+        self._remove_course(course_id)
+        self._courses[course_id] = (title, instructor_id, instructor)
+        self._insert(title, 'course')
+        self._insert(instructor, 'instructor')
+
+    def _remove_course(self, course_id):
+        labels = self._courses.pop(course_id, None)
+        if labels is not None:
+            self._remove(labels[0], 'course')
+            self._remove(labels[2], 'instructor')
+
+    def _build(self):
+        """
+        Index structures for every course, read from the database and sorted
+        once (inserting entries one by one would be quadratic)
+        """
+        courses = {}
+        label_counts = {}
+        entries = []
+        rows = Course.objects.values_list('id', 'title', 'instructor_id', 'instructor__username')
+        for course_id, title, instructor_id, instructor in rows.iterator():
+            courses[course_id] = (title, instructor_id, instructor)
+            for label, kind in ((title, 'course'), (instructor, 'instructor')):
+                count = label_counts.get((label, kind), 0)
+                label_counts[(label, kind)] = count + 1
+                if not count:
+                    entries.extend(self._label_entries(label, kind))
+        entries.sort()
+        return courses, label_counts, entries, [entry[0] for entry in entries]
+
+    def _shared_version(self):
+        """
+        The index version in the shared cache. A missing (evicted) version
+        restarts from the clock, never from a number some process may
+        already hold.
+        """
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(VERSION_CACHE_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_CACHE_KEY)
+        return version
+
+    def _publish(self, course_ids):
+        """
+        Bump the shared version and record which courses changed under it
+        """
+        try:
+            version = cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            # Evicted: the reseeded version makes every process rebuild
+            self._shared_version()
+            return
+        cache.set(CHANGE_CACHE_KEY.format(version), list(course_ids), CHANGE_CACHE_TIMEOUT)
+
+    def _changed(self, course_ids):
+        """
+        Publish a change once the current transaction commits, so no
+        process reloads the courses before it can see the new rows
+        """
+        transaction.on_commit(lambda: self._publish(course_ids()))
+
+    def update_course(self, course):
+        self._changed(lambda: [course.pk])
+
+    def remove_course(self, course_id):
+        self._changed(lambda: [course_id])
+
+    def rename_instructor(self, user):
+        self._changed(lambda: list(Course.objects.filter(instructor_id=user.pk).values_list('id', flat=True)))
+
+    def _pending_changes(self, version):
+        """
+        Ids of the courses changed between self.version and `version`, and
+        the version they bring the index to; None if only a full rebuild
+        can catch up
+        """
+        current = self.version
+        if current is None or not 0 < version - current <= settings.AUTOCOMPLETE_MAX_CHANGES:
+            return None
+        keys = [CHANGE_CACHE_KEY.format(number) for number in range(current + 1, version + 1)]
+        changes = cache.get_many(keys)
+        course_ids = set()
+        reached = current
+        for key in keys:
+            if key not in changes:
+                break
+            course_ids.update(changes[key])
+            reached += 1
+        # The newest record may be being written right now; an older gap
+        # means a record was evicted
+        if reached < version - 1:
+            return None
+        return course_ids, reached
+
+    def _catch_up(self, version):
+        start_version = self.version
+        pending = self._pending_changes(version)
+        if pending is None:
+            # Build outside the lock so suggestions keep being served meanwhile
+            built = self._build()
+            with self._lock:
+                if self.version == start_version:
+                    self._courses, self._label_counts, self._entries, self._keys = built
+                    self._results.clear()
+                    self.version = version
+            return
+
+        course_ids, reached = pending
+        rows = Course.objects.filter(id__in=course_ids).values_list(
+            'id', 'title', 'instructor_id', 'instructor__username'
+        )
+        found = {row[0]: row for row in rows}
+        with self._lock:
+            if self.version != start_version:
+                return
+            for course_id in course_ids:
+                if course_id in found:
+                    self._add_course(*found[course_id])
+                else:
+                    self._remove_course(course_id)
+            self._results.clear()
+            self.version = reached
+
+    def suggest(self, prefix, limit):
+        """
+        Up to `limit` (label, kind) pairs whose label has a word starting
+        with `prefix`, labels that start with it first
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        version = self._shared_version()
+        if self.version != version:
+            self._catch_up(version)
+
+        with self._lock:
+
+            cache_key = (prefix, limit)
+            results = self._results.get(cache_key)
+            if results is not None:
+                self._results.move_to_end(cache_key)
+                return results
+
+            matches = []
+            position = bisect.bisect_left(self._keys, prefix)
+            while position < len(self._keys) and self._keys[position].startswith(prefix):
+                _, start, label, kind = self._entries[position]
+                matches.append((start, label, kind))
+                position += 1
+            seen = set()
+            results = []
+            for _, label, kind in sorted(matches, key=lambda match: (match[0], match[1].lower())):
+                if (label, kind) not in seen:
+                    seen.add((label, kind))
+                    results.append((label, kind))
+                    if len(results) == limit:
+                        break
+
+            self._results[cache_key] = results
+            while len(self._results) > self.result_cache_size:
+                self._results.popitem(last=False)
+            return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prefix_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PrefixIndex(settings.AUTOCOMPLETE_RESULT_CACHE_SIZE)
+        return _index
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class BlockCache:
+    """
+    Per-process LRU cache of fixed-size file blocks with a memory ceiling.
+    Keys are (file name, file version, block index); only blocks in the hot
+    zone at the start or end of a file (startup buffering and a trailing
+    moov atom) are cached.
+    """
+
+    def __init__(self, max_bytes, block_size, hot_bytes):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.hot_bytes = hot_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_hot(self, offset, file_size):
+        """
+        True if the byte at `offset` lies within hot_bytes of either end of the file
+        """
+        return offset < self.hot_bytes or offset >= file_size - self.hot_bytes
+
+    def covers(self, start, end, file_size):
+        """
+        True if bytes [start, end] lie entirely within one hot zone
+        """
+        return end < self.hot_bytes or start >= file_size - self.hot_bytes
+
+    def get(self, key):
+        with self._lock:
+            data = self._blocks.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._blocks[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'blocks': len(self._blocks),
+            'bytes': self.size,
+        }
+
+
+class SharedBlockCache(BlockCache):
+    """
+    Block cache stored in a Django cache alias, shared by every worker that
+    uses the same cache server. Memory limits and eviction belong to that
+    backend, so `evictions` stays at zero here.
+    """
+
+    def __init__(self, block_size, hot_bytes, alias, timeout):
+        super().__init__(0, block_size, hot_bytes)
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def _cache_key(self, key):
+        return 'videoblock:' + hashlib.md5(repr(key).encode()).hexdigest()
+
+    def get(self, key):
+        data = self.cache.get(self._cache_key(key))
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, data):
+        self.cache.set(self._cache_key(key), data, self.timeout)
+
+    def clear(self):
+        pass
+
+
+_block_cache = None
+_block_cache_lock = threading.Lock()
+
+
+def get_block_cache():
+    """
+    Return the process-wide block cache configured by VIDEO_BLOCK_CACHE_BACKEND
+    ('local', 'django', or '' to disable), or None when caching is off
+    """
+    global _block_cache
+    backend = getattr(settings, 'VIDEO_BLOCK_CACHE_BACKEND', '')
+    if not backend:
+        return None
+
+    with _block_cache_lock:
+        if _block_cache is None:
+            if backend == 'local':
+                _block_cache = BlockCache(
+                    settings.VIDEO_BLOCK_CACHE_MAX_BYTES,
+                    settings.VIDEO_BLOCK_CACHE_BLOCK_SIZE,
+                    settings.VIDEO_BLOCK_CACHE_HOT_BYTES,
+                )
+            elif backend == 'django':
+                _block_cache = SharedBlockCache(
+                    settings.VIDEO_BLOCK_CACHE_BLOCK_SIZE,
+                    settings.VIDEO_BLOCK_CACHE_HOT_BYTES,
+                    settings.VIDEO_BLOCK_CACHE_ALIAS,
+                    settings.VIDEO_BLOCK_CACHE_TIMEOUT,
+                )
+            else:
+                raise ValueError(f'Unknown VIDEO_BLOCK_CACHE_BACKEND "{backend}"')
+        return _block_cache
@@ -0,0 +1,231 @@
+import math
+import os
+import shutil
+import struct
+import tempfile
+
+from .mp4 import (
+    Box, Mp4Error, read_moov, top_level_boxes, track_handler, track_id,
+    find_box, track_samples, track_timescale,
+)
+
+PLAYLIST_NAME = 'playlist.m3u8'
+INIT_SEGMENT_NAME = 'init.mp4'
+SEGMENT_NAME = 'seg_{:05d}.m4s'
+
+# trun sample flags: sync samples do not depend on others, the rest are non-sync
+SYNC_SAMPLE_FLAGS = 0x02000000
+NON_SYNC_SAMPLE_FLAGS = 0x01010000
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _full_box(box_type, version, flags, body):
+    return Box(box_type, payload=struct.pack('>I', (version << 24) | flags) + body)
+
+
+def _empty_table(box_type):
+    return _full_box(box_type, 0, 0, struct.pack('>I', 0))
+
+
+def init_segment(moov, tracks):
+    """
+    Build the fMP4 initialization segment: ftyp plus a moov whose sample
+    tables are empty, with an mvex/trex entry for each kept track
+    """
+    kept = {id(trak) for trak in tracks}
+    children = []
+    for child in moov.children:
+        if child.type == b'trak' and id(child) not in kept:
+            continue
+        if child.type == b'mvex':
+            continue
+        if child.type == b'trak':
+            stbl = find_box(child, b'mdia', b'minf', b'stbl')
+            stsd = find_box(stbl, b'stsd')
+            if stsd is None:
+                raise Mp4Error('Track without a sample description')
+            stbl.children = [
+                stsd,
+                _empty_table(b'stts'),
+                _empty_table(b'stsc'),
+                _full_box(b'stsz', 0, 0, struct.pack('>II', 0, 0)),
+                _empty_table(b'stco'),
+            ]
+        children.append(child)
+
+    trex = [
+        _full_box(b'trex', 0, 0, struct.pack('>IIIII', track_id(trak), 1, 0, 0, 0))
+        for trak in tracks
+    ]
+    children.append(Box(b'mvex', children=trex))
+
+    ftyp = Box(b'ftyp', payload=b'iso6' + struct.pack('>I', 0) + b'iso6mp41')
+    return ftyp.serialize() + Box(b'moov', children=children).serialize()
+
+
+def _moof(sequence, track_parts, data_offsets):
+    trafs = []
+    for (trak_id, base_time, samples), data_offset in zip(track_parts, data_offsets):
+        entries = b''.join(
+            struct.pack(
+                '>IIIi',
+                sample.duration,
+                sample.size,
+                SYNC_SAMPLE_FLAGS if sample.is_sync else NON_SYNC_SAMPLE_FLAGS,
+                sample.composition_offset,
+            )
+            for sample in samples
+        )
+        trafs.append(Box(b'traf', children=[
+            # default-base-is-moof: data offsets are relative to the moof start
+            _full_box(b'tfhd', 0, 0x020000, struct.pack('>I', trak_id)),
+            _full_box(b'tfdt', 1, 0, struct.pack('>Q', base_time)),
+            # data-offset, sample duration, size, flags and composition offset present
+            _full_box(b'trun', 1, 0x000F01, struct.pack('>Ii', len(samples), data_offset) + entries),
+        ]))
+    mfhd = _full_box(b'mfhd', 0, 0, struct.pack('>I', sequence))
+    return Box(b'moof', children=[mfhd] + trafs).serialize()
+
+
+def write_media_segment(source, path, sequence, track_parts):
+    """
+    Write one moof+mdat segment. `track_parts` is a list of
+    (track id, base decode time, samples); sample data is copied from
+    `source` one sample at a time.
+    """
+    placeholder = _moof(sequence, track_parts, [0] * len(track_parts))
+    data_offsets = []
+    position = len(placeholder) + 8
+    for _, _, samples in track_parts:
+        data_offsets.append(position)
+        position += sum(sample.size for sample in samples)
+    moof = _moof(sequence, track_parts, data_offsets)
+    mdat_size = position - len(moof)
+
+    with open(path, 'wb') as target:
+        target.write(moof)
+        target.write(struct.pack('>I4s', mdat_size, b'mdat'))
+        for _, _, samples in track_parts:
+            for sample in samples:
+                source.seek(sample.offset)
+                remaining = sample.size
+                while remaining > 0:
+                    chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise Mp4Error('Unexpected end of file')
+                    target.write(chunk)
+                    remaining -= len(chunk)
+
+
+def _segment_boundaries(samples, timescale, target_duration):
+    """
+    Start times (seconds) of each segment: cut at the first sync sample
+    at least `target_duration` after the current segment start
+    """
+    boundaries = [0.0]
+    for sample in samples:
+        seconds = sample.time / timescale
+        if sample.is_sync and seconds - boundaries[-1] >= target_duration:
+            boundaries.append(seconds)
+    return boundaries
+
+
+def segment_mp4(path, output_dir, target_duration):
+    """
+    Split the progressive MP4 at `path` into fragmented-MP4 segments of
+    about `target_duration` seconds in `output_dir`, with an init segment
+    and an HLS VOD playlist. The output is built in a temporary directory
+    and moved into place when complete.
+
+    Returns the number of media segments.
+    """
+    with open(path, 'rb') as source:
+        moov = read_moov(source, top_level_boxes(source))
+        tracks = [
+            trak for trak in moov.children
+            if trak.type == b'trak' and track_handler(trak) in (b'vide', b'soun')
+        ]
+        if not tracks:
+            raise Mp4Error('No audio or video tracks')
+
+        track_data = []
+        for trak in tracks:
+            timescale = track_timescale(trak)
+            if not timescale:
+                raise Mp4Error('Track without a timescale')
+            track_data.append((track_id(trak), timescale, track_samples(trak)))
+
+        # Segment on the video track's keyframes, or on the first track
+        main = next(
+            (data for trak, data in zip(tracks, track_data) if track_handler(trak) == b'vide'),
+            track_data[0],
+        )
+        boundaries = _segment_boundaries(main[2], main[1], target_duration)
+        total = max(
+            (samples[-1].time + samples[-1].duration) / timescale
+            for _, timescale, samples in track_data if samples
+        )
+        boundaries.append(max(total, boundaries[-1]))
+
+        parent = os.path.dirname(os.path.normpath(output_dir))
+        os.makedirs(parent, exist_ok=True)
+        work_dir = tempfile.mkdtemp(dir=parent, prefix='.segmenting-')
+        try:
+            os.chmod(work_dir, 0o755)
+            with open(os.path.join(work_dir, INIT_SEGMENT_NAME), 'wb') as init_file:
+                init_file.write(init_segment(moov, tracks))
+
+            durations = []
+            cursors = [0] * len(track_data)
+            for sequence in range(1, len(boundaries)):
+                start, end = boundaries[sequence - 1], boundaries[sequence]
+                last = sequence == len(boundaries) - 1
+                parts = []
+                for index, (trak_id, timescale, samples) in enumerate(track_data):
+                    first = cursors[index]
+                    cursor = first
+                    while cursor < len(samples) and (last or samples[cursor].time / timescale < end):
+                        cursor += 1
+                    cursors[index] = cursor
+                    chunk = samples[first:cursor]
+                    base_time = chunk[0].time if chunk else round(start * timescale)
+                    parts.append((trak_id, base_time, chunk))
+                if not any(chunk for _, _, chunk in parts):
+                    continue
+                durations.append(end - start)
+                write_media_segment(
+                    source, os.path.join(work_dir, SEGMENT_NAME.format(len(durations))), len(durations), parts
+                )
+
+            with open(os.path.join(work_dir, PLAYLIST_NAME), 'w') as playlist:
+                playlist.write(build_playlist(durations))
+
+            if os.path.isdir(output_dir):
+                shutil.rmtree(output_dir)
+            os.replace(work_dir, output_dir)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+
+    return len(durations)
+
+
+def build_playlist(durations):
+    """
+    HLS VOD media playlist for segments written by segment_mp4
+    """
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:7',
+        f'#EXT-X-TARGETDURATION:{math.ceil(max(durations, default=0))}',
+        '#EXT-X-MEDIA-SEQUENCE:1',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+        f'#EXT-X-MAP:URI="{INIT_SEGMENT_NAME}"',
+    ]
+    for number, duration in enumerate(durations, start=1):
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(SEGMENT_NAME.format(number))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, Video
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """
+    Register the function run for jobs of `kind`. It receives the job's
+    Video; a job whose video has been deleted is simply marked done.
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, video, delay=0):
+    """
+    Queue a job for `video`. The row is written in the caller's
+    transaction, so workers only see it once that commits.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'No handler registered for job kind "{kind}"')
+    job = Job.objects.create(
+        kind=kind,
+        video=video,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    Video.objects.filter(pk=video.pk).update(processing_status=Video.PROCESSING_PENDING)
+    if settings.JOBS_RUN_IMMEDIATELY:
+        transaction.on_commit(lambda: run_job(job))
+    return job
+
+
+def _sync_video_status(video_id):
+    """
+    Derive Video.processing_status from the video's jobs
+    """
+    jobs = Job.objects.filter(video_id=video_id)
+    if jobs.filter(status=Job.RUNNING).exists():
+        status = Video.PROCESSING_RUNNING
+    elif jobs.filter(status=Job.PENDING).exists():
+        status = Video.PROCESSING_PENDING
+    elif jobs.filter(status=Job.FAILED).exists():
+        status = Video.PROCESSING_FAILED
+    else:
+        status = Video.PROCESSING_READY
+    Video.objects.filter(pk=video_id).update(processing_status=status)
+
+
+def fail_abandoned_jobs():
+    """
+    Mark failed the running jobs whose lease ran out on their last allowed
+    attempt. A job that kills its worker (out of memory, a crash in a
+    parser) never reaches run_job's error handling, so without this it
+    would be claimed again forever.
+    """
+    now = timezone.now()
+    abandoned = list(Job.objects.filter(
+        status=Job.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts'),
+    ).values_list('id', 'video_id', 'locked_until'))
+    for job_id, video_id, locked_until in abandoned:
+        failed = Job.objects.filter(id=job_id, status=Job.RUNNING, locked_until=locked_until).update(
+            status=Job.FAILED,
+            locked_until=None,
+            finished_at=now,
+            last_error='The worker running this job stopped before it finished',
+        )
+        if failed:
+            _sync_video_status(video_id)
+
+
+def claim_jobs(limit):
+    """
+    Claim up to `limit` runnable jobs: pending ones that are due, and
+    running ones whose worker lease ran out (the worker died) and that have
+    attempts left. Each claim is a conditional UPDATE, so concurrent
+    runners never take the same job.
+    """
+    fail_abandoned_jobs()
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        Q(status=Job.PENDING, run_after__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+    ).order_by('run_after', 'id').values_list('id', 'status', 'locked_until')[:limit * 2]
+
+    claimed = []
+    for job_id, status, locked_until in candidates:
+        won = Job.objects.filter(id=job_id, status=status, locked_until=locked_until).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=settings.JOB_LEASE),
+        )
+        if won:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(id__in=claimed).order_by('run_after', 'id'))
+
+
+def renew_leases(job_ids):
+    """
+    Extend the lease of jobs this runner is still working on, so a job that
+    runs longer than JOB_LEASE is not taken for abandoned and run twice
+    """
+    if job_ids:
+        Job.objects.filter(id__in=job_ids, status=Job.RUNNING).update(
+            locked_until=timezone.now() + timedelta(seconds=settings.JOB_LEASE),
+        )
+
+
+def run_job(job):
+    """
+    Run one claimed job and record the outcome. A failure is retried with
+    exponential back-off until max_attempts, then the job is marked failed.
+    """
+    if job.status != Job.RUNNING:
+        # Run without a runner (JOBS_RUN_IMMEDIATELY): claim it here
+        claimed = Job.objects.filter(id=job.id, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=timezone.now() + timedelta(seconds=settings.JOB_LEASE),
+        )
+        if not claimed:
+            return
+        job.refresh_from_db()
+
+    if job.video_id:
+        _sync_video_status(job.video_id)
+    try:
+        video = Video.objects.filter(pk=job.video_id).first()
+        if video is not None:
+            HANDLERS[job.kind](video)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.id, job.kind, job.attempts)
+        if job.attempts < job.max_attempts:
+            retry_in = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            Job.objects.filter(id=job.id).update(
+                status=Job.PENDING,
+                locked_until=None,
+                run_after=timezone.now() + timedelta(seconds=retry_in),
+                last_error=traceback.format_exc(),
+            )
+        else:
+            Job.objects.filter(id=job.id).update(
+                status=Job.FAILED,
+                locked_until=None,
+                finished_at=timezone.now(),
+                last_error=traceback.format_exc(),
+            )
+    else:
+        Job.objects.filter(id=job.id).update(
+            status=Job.DONE,
+            locked_until=None,
+            finished_at=timezone.now(),
+        )
+    finally:
+        if job.video_id:
+            _sync_video_status(job.video_id)
+
+
+def _run_in_worker(job):
+    try:
+        run_job(job)
+    finally:
+        # Worker threads keep their own database connections
+        close_old_connections()
+
+
+def run_worker(workers, poll_interval, stop_event=None, once=False):
+    """
+    Poll for due jobs and run them on a pool of `workers` threads until
+    `stop_event` is set (or, with `once`, until the queue is drained)
+    """
+    stop_event = stop_event or threading.Event()
+    in_flight = {}
+    last_heartbeat = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker') as executor:
+        while not stop_event.is_set():
+            in_flight = {future: job_id for future, job_id in in_flight.items() if not future.done()}
+            if time.monotonic() - last_heartbeat >= settings.JOB_HEARTBEAT_INTERVAL:
+                renew_leases(list(in_flight.values()))
+                last_heartbeat = time.monotonic()
+
+            free = workers - len(in_flight)
+            jobs = claim_jobs(free) if free else []
+            for job in jobs:
+                in_flight[executor.submit(_run_in_worker, job)] = job.id
+
+            if not jobs:
+                if once and not in_flight:
+                    break
+                stop_event.wait(poll_interval)
+        close_old_connections()
@@ -0,0 +1,233 @@
+import heapq
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from LibraryApp.models import Course, MediaBlob, Video, VideoUpload
+from LibraryApp.storage import delete_unused_blob
+
+# Storage directories scanned for files nothing references
+MEDIA_PREFIXES = ('course_videos', 'thumbnails')
+
+# Binary collations, so the database sorts names exactly like Python does
+BINARY_COLLATIONS = {
+    'postgresql': 'C',
+    'sqlite': 'BINARY',
+    'mysql': 'utf8mb4_bin',
+}
+
+
+def stored_files(root, prefix):
+    """
+    Yield (name, os.DirEntry) for every file under MEDIA_ROOT/`prefix`,
+    sorted by storage name. Only one directory listing is held at a time.
+    """
+    try:
+        with os.scandir(os.path.join(root, prefix)) as iterator:
+            entries = list(iterator)
+    except FileNotFoundError:
+        return
+    # "a/..." sorts after "a.mp4", so directories compare with their slash
+    entries.sort(key=lambda entry: entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name)
+    for entry in entries:
+        name = f'{prefix}/{entry.name}'
+        if entry.is_dir(follow_symlinks=False):
+            yield from stored_files(root, name)
+        else:
+            yield name, entry
+
+
+def referenced_names(queryset, field, prefix, batch_size):
+    """
+    Yield the storage names in `field` of `queryset` that start with
+    `prefix`, sorted, fetched in keyset batches of `batch_size`
+    """
+    collation = BINARY_COLLATIONS.get(connection.vendor)
+    key = Collate(F(field), collation) if collation else F(field)
+    queryset = queryset.annotate(media_name=key).filter(media_name__startswith=f'{prefix}/').order_by('media_name')
+    last = None
+    while True:
+        batch = queryset.filter(media_name__gt=last) if last is not None else queryset
+        names = list(batch.values_list('media_name', flat=True)[:batch_size])
+        yield from names
+        if len(names) < batch_size:
+            return
+        last = names[-1]
+
+
+def is_referenced(name):
+    """
+    Check a single name again just before deleting it, in case it was
+    saved since the scan read that part of the table
+    """
+    return (
+        Video.objects.filter(video_file=name).exists()
+        or Course.objects.filter(thumbnail=name).exists()
+        or MediaBlob.objects.filter(name=name).exists()
+        or VideoUpload.objects.filter(file_name=name).exists()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete files under media/course_videos/ and media/thumbnails/ that "
+        "no Video, Course, MediaBlob or VideoUpload refers to, blobs that no "
+        "video uses any more, and resumable uploads abandoned before they "
+        "finished"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='List what would be deleted without deleting anything',
+        )
+        parser.add_argument(
+            '--min-age', type=float, default=24,
+            help='Only delete files and blobs older than this many hours (default: 24), '
+                 'so uploads in progress are left alone',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Threads deleting files in parallel (default: 4)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Names read from the database per query, and files deleted per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        cutoff = time.time() - options['min_age'] * 3600
+
+        started_before = timezone.now() - timedelta(hours=options['min_age'])
+
+        # Unfinished uploads nobody has written to within --min-age
+        abandoned = list(self._abandoned_uploads(started_before, cutoff))
+        if dry_run:
+            uploads = len(abandoned)
+            for upload in abandoned:
+                self.stdout.write(upload.file_name)
+            kept_uploads = VideoUpload.objects.exclude(pk__in=[upload.pk for upload in abandoned])
+        else:
+            uploads = sum(self._discard_upload(upload) for upload in abandoned)
+            kept_uploads = VideoUpload.objects.all()
+
+        # Blobs whose last video is gone; their files are then unreferenced
+        unused_blobs = MediaBlob.objects.filter(ref_count=0, created_at__lt=started_before)
+        if dry_run:
+            blobs = unused_blobs.count()
+        else:
+            # One locked, conditional delete per blob, which loses to a save
+            # taking a reference in the meantime
+            blobs = sum(
+                delete_unused_blob(digest)
+                for digest in unused_blobs.values_list('sha256', flat=True).iterator(chunk_size=batch_size)
+            )
+
+        root = default_storage.path('')
+        orphans = 0
+        orphan_bytes = 0
+        deleted = 0
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='clean-media') as executor:
+            for prefix in MEDIA_PREFIXES:
+                batch = []
+                for name, entry in self._orphans(root, prefix, batch_size, kept_uploads, unused_blobs):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    orphans += 1
+                    orphan_bytes += stat.st_size
+                    if dry_run:
+                        self.stdout.write(name)
+                        continue
+                    batch.append((name, entry.path))
+                    if len(batch) == batch_size:
+                        deleted += sum(executor.map(self._delete, batch))
+                        batch = []
+                if batch:
+                    deleted += sum(executor.map(self._delete, batch))
+
+        size = f'{orphan_bytes / 1024 ** 2:.1f} MB'
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'Would delete {orphans} orphaned files ({size}), {blobs} unused blobs '
+                f'and {uploads} abandoned uploads'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {deleted} of {orphans} orphaned files ({size}), {blobs} unused blobs '
+                f'and {uploads} abandoned uploads'
+            ))
+
+    def _abandoned_uploads(self, started_before, cutoff):
+        """
+        Yield the uploads without a Video that were started before
+        `started_before` and whose partial file was last written before
+        `cutoff` (a timestamp), or is missing
+        """
+        unfinished = VideoUpload.objects.filter(video__isnull=True, created_at__lt=started_before)
+        for upload in unfinished.only('pk', 'file_name', 'offset').iterator():
+            try:
+                written = os.stat(default_storage.path(upload.file_name)).st_mtime
+            except FileNotFoundError:
+                written = 0
+            if written < cutoff:
+                yield upload
+
+    def _discard_upload(self, upload):
+        """
+        Delete an abandoned upload and its partial file, unless a chunk was
+        written or the upload finished since it was read
+        """
+        deleted = VideoUpload.objects.filter(
+            Q(busy_until__isnull=True) | Q(busy_until__lt=timezone.now()),
+            pk=upload.pk,
+            offset=upload.offset,
+            video__isnull=True,
+        ).delete()[0]
+        if deleted:
+            default_storage.delete(upload.file_name)
+        return bool(deleted)
+
+    def _orphans(self, root, prefix, batch_size, uploads, unused_blobs):
+        """
+        Merge-join the sorted storage listing with the sorted referenced
+        names and yield the files that are not referenced
+        """
+        sources = [
+            referenced_names(Video.objects.all(), 'video_file', prefix, batch_size),
+            referenced_names(Course.objects.all(), 'thumbnail', prefix, batch_size),
+            # Abandoned uploads were deleted above, or in a dry run would have been
+            referenced_names(uploads, 'file_name', prefix, batch_size),
+            # Unused blobs were deleted above, or in a dry run would have been
+            referenced_names(MediaBlob.objects.exclude(pk__in=unused_blobs), 'name', prefix, batch_size),
+        ]
+        references = heapq.merge(*sources)
+        reference = next(references, None)
+        for name, entry in stored_files(root, prefix):
+            while reference is not None and reference < name:
+                reference = next(references, None)
+            if reference != name:
+                yield name, entry
+
+    def _delete(self, item):
+        name, path = item
+        try:
+            if is_referenced(name):
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        finally:
+            # Worker threads keep their own database connections
+            close_old_connections()
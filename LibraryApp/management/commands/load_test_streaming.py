@@ -0,0 +1,154 @@
+import asyncio
+import random
+import statistics
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from LibraryApp.models import Video
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test serve_video and serve_video_async on a running server with "
+        "many concurrent simulated players, each making range requests at "
+        "random offsets. Start the server first, e.g. "
+        "`uvicorn Library.asgi:application --port 8000` (under ASGI the sync "
+        "view runs in the sync_to_async thread pool, which is what the async "
+        "view avoids) or `gunicorn Library.wsgi` for the WSGI path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('video_id', type=int)
+        parser.add_argument(
+            '--user', required=True,
+            help='Username the players log in as (must be able to watch the video)',
+        )
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help='Server to test (default: http://127.0.0.1:8000)',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=500,
+            help='Simulated players running at once (default: 500)',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=4,
+            help='Range requests per player (default: 4)',
+        )
+        parser.add_argument(
+            '--range-size', type=int, default=1024 * 1024,
+            help='Bytes per range request (default: 1 MB)',
+        )
+        parser.add_argument(
+            '--views', default='sync,async',
+            help='Comma-separated views to test: sync, async (default: both)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            video = Video.objects.get(id=options['video_id'])
+            user = User.objects.get(username=options['user'])
+        except (Video.DoesNotExist, User.DoesNotExist) as exc:
+            raise CommandError(str(exc))
+        file_size = video.video_file.size
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self._login(user)}'
+        paths = {
+            'sync': reverse('serve_video', args=[video.id]),
+            'async': reverse('serve_video_async', args=[video.id]),
+        }
+
+        for view in options['views'].split(','):
+            if view not in paths:
+                raise CommandError(f'Unknown view "{view}"')
+            results = asyncio.run(self._run(options, paths[view], cookie, file_size))
+            self._report(view, options, results)
+
+    def _login(self, user):
+        """
+        Create a session for `user` directly, as login() would
+        """
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    async def _run(self, options, path, cookie, file_size):
+        url = urlsplit(options['base_url'])
+        started = time.perf_counter()
+        players = [
+            self._player(url, path, cookie, file_size, options['requests'], options['range_size'])
+            for _ in range(options['concurrency'])
+        ]
+        outcomes = await asyncio.gather(*players)
+        elapsed = time.perf_counter() - started
+        latencies = [latency for player in outcomes for latency in player[0]]
+        received = sum(player[1] for player in outcomes)
+        errors = sum(player[2] for player in outcomes)
+        return elapsed, latencies, received, errors
+
+    async def _player(self, url, path, cookie, file_size, count, range_size):
+        latencies = []
+        received = 0
+        errors = 0
+        for _ in range(count):
+            start = random.randrange(max(file_size - range_size, 1))
+            end = min(start + range_size, file_size) - 1
+            began = time.perf_counter()
+            try:
+                body_size = await self._fetch(url, path, cookie, start, end)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                continue
+            if body_size != end - start + 1:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - began)
+            received += body_size
+        return latencies, received, errors
+
+    async def _fetch(self, url, path, cookie, start, end):
+        """
+        One HTTP/1.1 range request; returns the body size of a 206 response
+        """
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        try:
+            writer.write((
+                f'GET {path} HTTP/1.1\r\n'
+                f'Host: {url.netloc}\r\n'
+                f'Cookie: {cookie}\r\n'
+                f'Range: bytes={start}-{end}\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode())
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            if not head.startswith(b'HTTP/1.1 206'):
+                raise ValueError(head.split(b'\r\n', 1)[0])
+            received = 0
+            while chunk := await reader.read(256 * 1024):
+                received += len(chunk)
+            return received
+        finally:
+            writer.close()
+
+    def _report(self, view, options, results):
+        elapsed, latencies, received, errors = results
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'{view}: every request failed ({errors} errors)'))
+            return
+        latencies.sort()
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        self.stdout.write(
+            f"{view:>5}: {options['concurrency']} players, {len(latencies) / elapsed:7.1f} req/s, "
+            f'{received / 1024 ** 2 / elapsed:7.1f} MB/s, '
+            f'latency p50 {statistics.median(latencies) * 1000:.0f} ms / p95 {p95 * 1000:.0f} ms, '
+            f'{errors} errors'
+        )
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from LibraryApp.models import Course, Enrollment, Video
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify the stored video_count, enrollment_count and total_duration "
+        "of every course against the Video and Enrollment tables, and fix "
+        "any that have drifted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report courses whose counters are wrong; exit with an error if any are',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Courses verified per batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = 0
+        wrong = 0
+        last_id = 0
+
+        while True:
+            # Keyset batches on id, each verified and fixed in its own transaction
+            with transaction.atomic():
+                courses = list(
+                    Course.objects.filter(id__gt=last_id).order_by('id')
+                    .select_for_update()
+                    .only('id', *Course.COUNTER_FIELDS)[:batch_size]
+                )
+                if not courses:
+                    break
+                last_id = courses[-1].id
+                ids = [course.id for course in courses]
+
+                videos = {
+                    row['course_id']: row
+                    for row in Video.objects.filter(course_id__in=ids).order_by()
+                    .values('course_id').annotate(count=Count('id'), duration=Sum('duration'))
+                }
+                enrollments = dict(
+                    Enrollment.objects.filter(course_id__in=ids).order_by()
+                    .values('course_id').annotate(count=Count('id')).values_list('course_id', 'count')
+                )
+
+                stale = []
+                for course in courses:
+                    video_row = videos.get(course.id, {})
+                    expected = (
+                        video_row.get('count', 0),
+                        enrollments.get(course.id, 0),
+                        video_row.get('duration') or 0,
+                    )
+                    stored = (course.video_count, course.enrollment_count, course.total_duration)
+                    if stored[:2] != expected[:2] or abs(stored[2] - expected[2]) > 1e-6:
+                        self.stdout.write(f'Course {course.id}: stored {stored}, expected {expected}')
+                        course.video_count, course.enrollment_count, course.total_duration = expected
+                        stale.append(course)
+
+                if stale and not options['check']:
+                    Course.objects.bulk_update(stale, Course.COUNTER_FIELDS)
+                checked += len(courses)
+                wrong += len(stale)
+
+        if options['check']:
+            if wrong:
+                raise CommandError(f'{wrong} of {checked} courses have wrong counters')
+            self.stdout.write(self.style.SUCCESS(f'All {checked} courses have correct counters'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} courses, fixed {wrong}'))
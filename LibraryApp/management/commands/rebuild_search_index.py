@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from LibraryApp.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Repopulate the SQLite full-text search table from the course table, "
+        "e.g. after courses were changed with raw SQL. On Postgres the index "
+        "covers the course table itself and there is nothing to rebuild."
+    )
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        if indexed is None:
+            self.stdout.write('This database has no search table to rebuild')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} courses'))
@@ -0,0 +1,39 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from LibraryApp.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (video processing) on a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOB_WORKERS,
+            help='Jobs run at the same time (default: JOB_WORKERS)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no jobs are due instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running jobs finish...')
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        self.stdout.write(f"Running jobs with {options['workers']} worker(s)")
+        run_worker(options['workers'], options['poll_interval'], stop_event, once=options['once'])
+        self.stdout.write(self.style.SUCCESS('Job runner stopped'))
@@ -0,0 +1,143 @@
+import os
+import shutil
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+
+from LibraryApp.models import Course, Video
+from LibraryApp.storage import BLOB_DIR, blob_digest, get_video_storage, release_blob
+
+
+def link_file(source, target):
+    """
+    Give the file at `source` a second name at `target`: a hard link, or a
+    copy across filesystems. Returns False if `source` does not exist.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        shutil.copy2(source, target)
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Move course thumbnails and video files stored in the old flat "
+        "directories to sharded paths: thumbnails as set by the field's "
+        "upload_to, videos into the content-addressed blob store. Safe to run "
+        "while the site is up and to run again after an interruption; files "
+        "already moved are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Rows read per batch (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        thumbnails = self.move_thumbnails(options['batch_size'])
+        videos = self.move_videos(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Moved {thumbnails} thumbnails and {videos} videos'))
+
+    def _batches(self, queryset, field, batch_size):
+        """
+        Yield keyset batches of `queryset` with a file in `field`. Nothing
+        is locked while files are linked, hashed and ingested; the batch is
+        then renamed at once by _rename.
+        """
+        last_id = 0
+        while True:
+            batch = list(
+                queryset.filter(id__gt=last_id).exclude(**{field: ''}).order_by('id')
+                .only('id', field)[:batch_size]
+            )
+            if not batch:
+                return
+            last_id = batch[-1].id
+            yield batch
+
+    def _rename(self, model, field, renames):
+        """
+        Point the rows in `renames` ({id: (old_name, new_name)}) at their new
+        names with one CASE update, skipping rows whose file was replaced
+        since the batch was read. Returns the ids that were renamed.
+        """
+        if not renames:
+            return set()
+        with transaction.atomic():
+            current = dict(
+                model.objects.select_for_update().filter(id__in=renames).values_list('id', field)
+            )
+            ids = {row_id for row_id, (old_name, _) in renames.items() if current.get(row_id) == old_name}
+            if ids:
+                model.objects.filter(id__in=ids).update(**{field: Case(
+                    *[When(id=row_id, then=Value(renames[row_id][1])) for row_id in ids],
+                    default=F(field),
+                    output_field=models.CharField(),
+                )})
+        return ids
+
+    def move_thumbnails(self, batch_size):
+        field = Course._meta.get_field('thumbnail')
+        moved = 0
+        for courses in self._batches(Course.objects.all(), 'thumbnail', batch_size):
+            renames = {}
+            for course in courses:
+                old_name = course.thumbnail.name
+                if field.upload_to.is_sharded(old_name):
+                    continue
+                new_name = field.storage.get_available_name(
+                    field.generate_filename(course, os.path.basename(old_name)),
+                    max_length=field.max_length,
+                )
+                if not link_file(field.storage.path(old_name), field.storage.path(new_name)):
+                    self.stderr.write(f'Course {course.id}: {old_name} is missing, skipped')
+                    continue
+                renames[course.id] = (old_name, new_name)
+
+            renamed = self._rename(Course, 'thumbnail', renames)
+            for course_id, (old_name, new_name) in renames.items():
+                if course_id in renamed:
+                    field.storage.delete(old_name)
+                else:
+                    # The thumbnail was replaced meanwhile; drop the copy
+                    field.storage.delete(new_name)
+            moved += len(renamed)
+            if renamed:
+                self.stdout.write(f'Moved {moved} thumbnails (up to course {courses[-1].id})')
+        return moved
+
+    def move_videos(self, batch_size):
+        storage = get_video_storage()
+        moved = 0
+        for videos in self._batches(Video.objects.all(), 'video_file', batch_size):
+            renames = {}
+            for video in videos:
+                old_name = video.video_file.name
+                if blob_digest(old_name):
+                    continue
+                # Ingest a second name, so the old one stays valid until the row points elsewhere
+                staged = storage.path(f'{BLOB_DIR}/incoming/{uuid.uuid4().hex}{os.path.splitext(old_name)[1]}')
+                if not link_file(storage.path(old_name), staged):
+                    self.stderr.write(f'Video {video.id}: {old_name} is missing, skipped')
+                    continue
+                # ingest took a blob reference, which the video now holds
+                renames[video.id] = (old_name, storage.ingest(staged))
+
+            renamed = self._rename(Video, 'video_file', renames)
+            for video_id, (old_name, name) in renames.items():
+                if video_id in renamed:
+                    storage.delete(old_name)
+                else:
+                    # The file was replaced meanwhile
+                    release_blob(name)
+            moved += len(renamed)
+            if renamed:
+                self.stdout.write(f'Moved {moved} videos (up to video {videos[-1].id})')
+        return moved
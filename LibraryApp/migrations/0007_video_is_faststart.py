@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0006_remove_course_created_at_alter_course_thumbnail_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='is_faststart',
+            field=models.BooleanField(default=False),
+        ),
+    ]
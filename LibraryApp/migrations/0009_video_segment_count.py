@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0008_video_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='segment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
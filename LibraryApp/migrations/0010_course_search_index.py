@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# The DDL is frozen here rather than imported from LibraryApp.search, so
+# later changes to that module cannot change what this migration does.
+# The Postgres expression must match search.PG_DOCUMENT for the index to
+# be used.
+PG_CREATE = (
+    'CREATE INDEX IF NOT EXISTS "LibraryApp_course_search_idx" ON "LibraryApp_course" '
+    "USING GIN (to_tsvector('english'::regconfig, "
+    "COALESCE(title, '') || ' ' || COALESCE(description, '')))"
+)
+PG_DROP = 'DROP INDEX IF EXISTS "LibraryApp_course_search_idx"'
+
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS "LibraryApp_course_fts" USING fts5('
+    "title, description, instructor, tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_FILL = (
+    'INSERT INTO "LibraryApp_course_fts" (rowid, title, description, instructor) '
+    'SELECT c.id, c.title, c.description, u.username FROM "LibraryApp_course" c '
+    'JOIN auth_user u ON u.id = c.instructor_id'
+)
+SQLITE_DROP = 'DROP TABLE IF EXISTS "LibraryApp_course_fts"'
+
+
+def create_index(apps, schema_editor):
+    """
+    A GIN expression index on Postgres, an FTS5 table filled from the
+    existing courses on SQLite; other databases keep icontains filtering
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(PG_CREATE)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_FILL)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(PG_DROP)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0009_video_segment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0010_course_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['course', 'order'], name='video_course_order_idx'),
+        ),
+    ]
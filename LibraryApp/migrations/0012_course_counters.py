@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Course = apps.get_model('LibraryApp', 'Course')
+    Video = apps.get_model('LibraryApp', 'Video')
+    Enrollment = apps.get_model('LibraryApp', 'Enrollment')
+    videos = Video.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    enrollments = Enrollment.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    Course.objects.update(
+        video_count=Coalesce(Subquery(videos.annotate(n=Count('pk')).values('n')), 0),
+        total_duration=Coalesce(Subquery(videos.annotate(total=Sum('duration')).values('total')), 0.0),
+        enrollment_count=Coalesce(Subquery(enrollments.annotate(n=Count('pk')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0011_video_course_order_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='total_duration',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='video_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:59
+
+import LibraryApp.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0015_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='thumbnail',
+            field=models.ImageField(upload_to=LibraryApp.storage.ShardedUploadTo('thumbnails')),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='video_file',
+            field=models.FileField(storage=LibraryApp.storage.get_video_storage, upload_to=LibraryApp.storage.ShardedUploadTo('course_videos')),
+        ),
+    ]
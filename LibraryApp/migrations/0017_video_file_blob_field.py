@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:24
+
+import LibraryApp.storage
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryApp', '0016_sharded_upload_paths'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='video',
+            name='video_file',
+            field=LibraryApp.storage.BlobFileField(storage=LibraryApp.storage.get_video_storage, upload_to=LibraryApp.storage.ShardedUploadTo('course_videos')),
+        ),
+    ]
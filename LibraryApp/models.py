@@ -1,32 +1,129 @@
+import bisect
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .mp4 import unpack_seek_index
+from .storage import BlobFileField, ShardedUploadTo, get_video_storage
+
+
+def format_duration(seconds):
+    """
+    Duration as H:MM:SS or M:SS, or an empty string if unknown
+    """
+    if seconds is None:
+        return ''
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
 class Course(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
-    thumbnail = models.ImageField(upload_to='thumbnails/')
+    thumbnail = models.ImageField(upload_to=ShardedUploadTo('thumbnails'))
     instructor = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Maintained with F() updates by signals; rebuild with manage.py rebuild_course_counters
+    video_count = models.PositiveIntegerField(default=0, editable=False)
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+    total_duration = models.FloatField(default=0, editable=False)  # seconds
+    
+    COUNTER_FIELDS = ('video_count', 'enrollment_count', 'total_duration')
     
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """
+        Never write back the counters of an existing course: the in-memory
+        copy may be stale, and they are only changed with F() updates
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 class Video(models.Model):
     """
     Represents a single video lesson belonging to a course.
     """
     title = models.CharField(max_length=200)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='videos')
-    video_file = models.FileField(upload_to='course_videos/')
+    video_file = BlobFileField(upload_to=ShardedUploadTo('course_videos'), storage=get_video_storage)  # content addressed, see storage.py
     description = models.TextField(blank=True, null=True)
     order = models.PositiveIntegerField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    is_faststart = models.BooleanField(default=False)  # moov atom stored before mdat
+    duration = models.FloatField(blank=True, null=True)  # seconds
+    bitrate = models.PositiveIntegerField(blank=True, null=True)  # bits per second
+    seek_index = models.BinaryField(blank=True, null=True, editable=False)  # packed keyframe time -> byte offset
+    segment_count = models.PositiveIntegerField(default=0)  # fMP4/HLS segments; 0 if not segmented
+
+    PROCESSING_PENDING = 'pending'
+    PROCESSING_RUNNING = 'processing'
+    PROCESSING_READY = 'ready'
+    PROCESSING_FAILED = 'failed'
+    PROCESSING_STATUS_CHOICES = [
+        (PROCESSING_PENDING, 'Waiting to be processed'),
+        (PROCESSING_RUNNING, 'Processing'),
+        (PROCESSING_READY, 'Ready'),
+        (PROCESSING_FAILED, 'Processing failed'),
+    ]
+    # Summary of this video's background jobs (see jobs.py)
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUS_CHOICES, default=PROCESSING_READY)
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            # Playlist reads and lookups by (course, order)
+            models.Index(fields=['course', 'order'], name='video_course_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.course.title} - {self.order}. {self.title}"
 
+    def save(self, *args, **kwargs):
+        """
+        A failed save rolls back the blob reference taken for a new file
+        (see BlobFieldFile), so it must not be handed to post_save later
+        """
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            self.__dict__.pop('_blob_reference', None)
+            raise
+
+    @property
+    def duration_display(self):
+        """
+        Duration as H:MM:SS or M:SS, or an empty string if unknown
+        """
+        return format_duration(self.duration)
+
+    @property
+    def segments_dir(self):
+        """
+        Storage name of the directory holding this video's HLS segments
+        """
+        return f'segments/{self.pk}'
+
+    def keyframe_at(self, seconds):
+        """
+        Return (keyframe time, byte offset) of the last keyframe at or before
+        `seconds`, or None if the video has no seek index
+        """
+        times, offsets = unpack_seek_index(self.seek_index)
+        if not times:
+            return None
+        position = max(bisect.bisect_right(times, seconds) - 1, 0)
+        return times[position], offsets[position]
+
 class Enrollment(models.Model):
     """
     Links a user to a course they are enrolled in.
@@ -39,4 +136,80 @@ class Enrollment(models.Model):
         unique_together = ('user', 'course')  # A user can only enroll in a course once
 
     def __str__(self):
-        return f"{self.user.username} enrolled in {self.course.title}"
\ No newline at end of file
+        return f"{self.user.username} enrolled in {self.course.title}"
+
+class Job(models.Model):
+    """
+    A unit of background work on a video, run by `manage.py run_jobs`
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)  # key of the handler in jobs.HANDLERS
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # not picked up before this time
+    locked_until = models.DateTimeField(blank=True, null=True)  # lease of the worker running it
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for video {self.video_id} ({self.status})"
+
+
+class VideoUpload(models.Model):
+    """
+    A resumable video upload. Chunks are appended to `file_name` in storage
+    until `offset` reaches `size`, then a Video is created from the file.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='uploads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True, null=True)
+    file_name = models.CharField(max_length=255)  # storage name the chunks are appended to
+    size = models.PositiveBigIntegerField()  # total bytes announced by the client
+    offset = models.PositiveBigIntegerField(default=0)  # bytes received so far
+    busy_until = models.DateTimeField(blank=True, null=True)  # lease held by the request writing a chunk
+    video = models.OneToOneField(Video, on_delete=models.SET_NULL, blank=True, null=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.offset}/{self.size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.size
+
+
+class MediaBlob(models.Model):
+    """
+    A video file stored once under its SHA-256 (see storage.py), shared by
+    every Video whose file has that content
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)  # storage name
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)  # videos using this blob
+    # Hash of the upload this blob was derived from (e.g. before faststart)
+    source_sha256 = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
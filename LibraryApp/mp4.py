@@ -0,0 +1,412 @@
+import os
+import stat
+import struct
+import tempfile
+from collections import namedtuple
+
+# Boxes that only contain other boxes (the ones this module needs to descend into)
+CONTAINER_BOXES = {
+    b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf', b'mvex', b'udta', b'moof', b'traf',
+}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Largest chunk offset a 32-bit stco table can hold
+STCO_MAX_OFFSET = 0xFFFFFFFF
+
+
+class Mp4Error(Exception):
+    """
+    The file is not an MP4/ISO BMFF file this module can handle
+    """
+
+
+def iter_boxes(file_object, start, end):
+    """
+    Yield (type, offset, header size, total size) for each box in [start, end)
+    """
+    offset = start
+    while offset + 8 <= end:
+        file_object.seek(offset)
+        header = file_object.read(8)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            largesize = file_object.read(8)
+            if len(largesize) < 8:
+                raise Mp4Error('Truncated 64-bit box header')
+            size = struct.unpack('>Q', largesize)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise Mp4Error(f'Invalid size for box {box_type!r} at offset {offset}')
+        yield box_type, offset, header_size, size
+        offset += size
+
+
+def top_level_boxes(file_object):
+    file_object.seek(0, os.SEEK_END)
+    return list(iter_boxes(file_object, 0, file_object.tell()))
+
+
+class Box:
+    """
+    An in-memory box: containers keep parsed children, leaves keep their payload
+    """
+
+    def __init__(self, box_type, payload=b'', children=None):
+        self.type = box_type
+        self.payload = payload
+        self.children = children
+
+    @classmethod
+    def parse(cls, data, box_type):
+        if box_type not in CONTAINER_BOXES:
+            return cls(box_type, payload=data)
+        children = []
+        offset = 0
+        while offset + 8 <= len(data):
+            size, child_type = struct.unpack_from('>I4s', data, offset)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from('>Q', data, offset + 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = len(data) - offset
+            if size < header_size or offset + size > len(data):
+                raise Mp4Error(f'Invalid size for box {child_type!r} inside {box_type!r}')
+            children.append(cls.parse(data[offset + header_size:offset + size], child_type))
+            offset += size
+        return cls(box_type, children=children)
+
+    def walk(self):
+        yield self
+        for child in self.children or ():
+            yield from child.walk()
+
+    def serialize(self):
+        if self.children is None:
+            body = self.payload
+        else:
+            body = b''.join(child.serialize() for child in self.children)
+        size = len(body) + 8
+        if size > 0xFFFFFFFF:
+            return struct.pack('>I4sQ', 1, self.type, size + 8) + body
+        return struct.pack('>I4s', size, self.type) + body
+
+
+def read_moov(file_object, boxes):
+    """
+    Parse the moov box found in `boxes`
+    """
+    for box_type, offset, header_size, size in boxes:
+        if box_type == b'moov':
+            file_object.seek(offset + header_size)
+            return Box.parse(file_object.read(size - header_size), b'moov')
+    raise Mp4Error('No moov box found')
+
+
+def chunk_offsets(box):
+    """
+    Return the chunk offset list of an stco or co64 box
+    """
+    count = struct.unpack_from('>I', box.payload, 4)[0]
+    fmt = '>%d%s' % (count, 'I' if box.type == b'stco' else 'Q')
+    return list(struct.unpack_from(fmt, box.payload, 8))
+
+
+def _set_chunk_offsets(box, offsets, use_co64):
+    version_flags = box.payload[:4]
+    if use_co64:
+        box.type = b'co64'
+        body = struct.pack('>%dQ' % len(offsets), *offsets)
+    else:
+        body = struct.pack('>%dI' % len(offsets), *offsets)
+    box.payload = version_flags + struct.pack('>I', len(offsets)) + body
+
+
+def is_faststart(path):
+    """
+    True if the moov box comes before the first mdat box
+    """
+    with open(path, 'rb') as file_object:
+        for box_type, _, _, _ in top_level_boxes(file_object):
+            if box_type == b'moov':
+                return True
+            if box_type == b'mdat':
+                return False
+    raise Mp4Error('No moov box found')
+
+
+def make_faststart(path, output=None):
+    """
+    Rewrite the MP4 at `path` so moov comes before mdat, shifting every
+    stco/co64 chunk offset to match. Media data is copied in fixed-size
+    chunks into a temporary file in the same directory, which then replaces
+    the original, so memory use is bounded by the size of moov. With
+    `output`, the result is written there instead and `path` is untouched.
+
+    Returns True if the file was rewritten, False if it was already faststart.
+    """
+    with open(path, 'rb') as source:
+        boxes = top_level_boxes(source)
+        types = [box[0] for box in boxes]
+        if b'moov' not in types or b'mdat' not in types:
+            raise Mp4Error('Not a progressive MP4 file')
+        if types.index(b'moov') < types.index(b'mdat'):
+            return False
+
+        moov_entry = boxes[types.index(b'moov')]
+        insert_at = boxes[types.index(b'mdat')][1]
+        old_moov_offset, old_moov_size = moov_entry[1], moov_entry[3]
+        moov = read_moov(source, boxes)
+
+        tables = [box for box in moov.walk() if box.type in (b'stco', b'co64')]
+        original = [chunk_offsets(box) for box in tables]
+
+        # Upgrade every table to co64 if any shifted offset stops fitting in 32 bits
+        use_co64 = any(box.type == b'co64' for box in tables)
+        while True:
+            for box, offsets in zip(tables, original):
+                _set_chunk_offsets(box, offsets, use_co64)
+            new_moov_size = len(moov.serialize())
+
+            def shift(offset):
+                if offset < insert_at:
+                    return offset
+                if offset < old_moov_offset:
+                    return offset + new_moov_size
+                return offset + new_moov_size - old_moov_size
+
+            shifted = [[shift(offset) for offset in offsets] for offsets in original]
+            if use_co64 or all(offset <= STCO_MAX_OFFSET for offsets in shifted for offset in offsets):
+                break
+            use_co64 = True
+
+        for box, offsets in zip(tables, shifted):
+            _set_chunk_offsets(box, offsets, use_co64)
+        moov_bytes = moov.serialize()
+
+        target_path = output or path
+        directory = os.path.dirname(target_path)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.faststart')
+        try:
+            os.chmod(temp_path, stat.S_IMODE(os.fstat(source.fileno()).st_mode))
+            with os.fdopen(fd, 'wb') as target:
+                for box_type, offset, _, size in boxes:
+                    if box_type == b'moov':
+                        continue
+                    if offset == insert_at:
+                        target.write(moov_bytes)
+                    _copy_range(source, target, offset, size)
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    return True
+
+
+def _copy_range(source, target, offset, size):
+    source.seek(offset)
+    remaining = size
+    while remaining > 0:
+        chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise Mp4Error('Unexpected end of file')
+        target.write(chunk)
+        remaining -= len(chunk)
+
+
+def _full_box_fields(box, layout_v0, layout_v1):
+    """
+    Unpack the fields after the version/flags word of a full box
+    """
+    version = box.payload[0]
+    return struct.unpack_from(layout_v1 if version == 1 else layout_v0, box.payload, 4)
+
+
+def _table(box, entry_format):
+    """
+    Return the entries of a sample table box (count followed by fixed-size entries)
+    """
+    count = struct.unpack_from('>I', box.payload, 4)[0]
+    entry_size = struct.calcsize('>' + entry_format)
+    return [
+        struct.unpack_from('>' + entry_format, box.payload, 8 + index * entry_size)
+        for index in range(count)
+    ]
+
+
+def find_box(box, *path):
+    for box_type in path:
+        box = next((child for child in box.children or () if child.type == box_type), None)
+        if box is None:
+            return None
+    return box
+
+
+Sample = namedtuple('Sample', 'time duration composition_offset size offset is_sync')
+
+
+def track_timescale(trak):
+    mdhd = find_box(trak, b'mdia', b'mdhd')
+    if mdhd is None:
+        return 0
+    return _full_box_fields(mdhd, '>III', '>QQI')[2]
+
+
+def track_handler(trak):
+    """
+    Return the handler type of a track, e.g. b'vide' or b'soun'
+    """
+    hdlr = find_box(trak, b'mdia', b'hdlr')
+    return hdlr.payload[8:12] if hdlr is not None else None
+
+
+def track_id(trak):
+    tkhd = find_box(trak, b'tkhd')
+    if tkhd is None:
+        raise Mp4Error('Track without a tkhd box')
+    return _full_box_fields(tkhd, '>III', '>QQI')[2]
+
+
+def track_samples(trak):
+    """
+    Return a Sample for every sample of a track, with times in the track's
+    timescale and absolute file offsets
+    """
+    stbl = find_box(trak, b'mdia', b'minf', b'stbl')
+    if stbl is None:
+        return []
+    stts, stsc, stsz = find_box(stbl, b'stts'), find_box(stbl, b'stsc'), find_box(stbl, b'stsz')
+    offsets_box = find_box(stbl, b'stco') or find_box(stbl, b'co64')
+    if not (stts and stsc and stsz and offsets_box):
+        return []
+
+    # Sample durations (stts is run-length encoded)
+    durations = []
+    for sample_count, delta in _table(stts, 'II'):
+        durations.extend([delta] * sample_count)
+
+    # Composition time offsets; version 1 stores them signed
+    ctts = find_box(stbl, b'ctts')
+    composition = []
+    if ctts is not None:
+        for sample_count, offset in _table(ctts, 'Ii' if ctts.payload[0] == 1 else 'II'):
+            composition.extend([offset] * sample_count)
+
+    uniform_size, sample_count = struct.unpack_from('>II', stsz.payload, 4)
+    if uniform_size:
+        sizes = [uniform_size] * sample_count
+    else:
+        sizes = list(struct.unpack_from('>%dI' % sample_count, stsz.payload, 12))
+
+    # Absolute offset of every sample, walking chunks through the stsc runs
+    chunk_offsets_list = chunk_offsets(offsets_box)
+    runs = _table(stsc, 'III')
+    offsets = []
+    for index, (first_chunk, samples_per_chunk, _) in enumerate(runs):
+        last_chunk = runs[index + 1][0] - 1 if index + 1 < len(runs) else len(chunk_offsets_list)
+        for chunk in range(first_chunk, last_chunk + 1):
+            position = chunk_offsets_list[chunk - 1]
+            for _ in range(samples_per_chunk):
+                if len(offsets) == sample_count:
+                    break
+                offsets.append(position)
+                position += sizes[len(offsets) - 1]
+
+    stss = find_box(stbl, b'stss')
+    sync = None if stss is None else {number - 1 for (number,) in _table(stss, 'I')}
+
+    samples = []
+    elapsed = 0
+    for number in range(min(len(durations), len(offsets))):
+        samples.append(Sample(
+            elapsed,
+            durations[number],
+            composition[number] if number < len(composition) else 0,
+            sizes[number],
+            offsets[number],
+            sync is None or number in sync,
+        ))
+        elapsed += durations[number]
+    return samples
+
+
+def _keyframe_index(trak):
+    """
+    Return [(seconds, byte offset)] for the sync samples of a track
+    """
+    timescale = track_timescale(trak)
+    if not timescale:
+        return []
+
+    index = []
+    all_sync = find_box(trak, b'mdia', b'minf', b'stbl', b'stss') is None
+    next_time = 0
+    for sample in track_samples(trak):
+        if not sample.is_sync:
+            continue
+        if all_sync:
+            # Every sample is a sync sample; keep about one entry per second
+            if sample.time < next_time:
+                continue
+            next_time = sample.time + timescale
+        index.append((sample.time / timescale, sample.offset))
+    return index
+
+
+def extract_metadata(path):
+    """
+    Read duration (seconds), average bitrate (bits/s) and a keyframe
+    (seconds, byte offset) index from the moov box of an MP4 file
+    """
+    with open(path, 'rb') as file_object:
+        boxes = top_level_boxes(file_object)
+        moov = read_moov(file_object, boxes)
+        file_size = file_object.seek(0, os.SEEK_END)
+
+    mvhd = find_box(moov, b'mvhd')
+    if mvhd is None:
+        raise Mp4Error('No mvhd box found')
+    timescale, duration = _full_box_fields(mvhd, '>IIII', '>QQIQ')[2:4]
+    seconds = duration / timescale if timescale else 0
+
+    keyframes = []
+    for trak in moov.children:
+        if trak.type == b'trak' and track_handler(trak) == b'vide':
+            keyframes = _keyframe_index(trak)
+            break
+
+    return {
+        'duration': seconds,
+        'bitrate': int(file_size * 8 / seconds) if seconds else None,
+        'keyframes': keyframes,
+    }
+
+
+def pack_seek_index(keyframes):
+    """
+    Pack [(seconds, offset)] into bytes: a count, then the times as
+    doubles, then the offsets as unsigned 64-bit integers
+    """
+    count = len(keyframes)
+    times = [time for time, _ in keyframes]
+    offsets = [offset for _, offset in keyframes]
+    return struct.pack('<I%dd%dQ' % (count, count), count, *times, *offsets)
+
+
+def unpack_seek_index(data):
+    """
+    Inverse of pack_seek_index: returns (times, offsets)
+    """
+    if not data:
+        return [], []
+    count = struct.unpack_from('<I', data)[0]
+    values = struct.unpack_from('<%dd%dQ' % (count, count), data, 4)
+    return list(values[:count]), list(values[count:])
@@ -0,0 +1,97 @@
+import bisect
+import time
+from collections import namedtuple
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.text import Truncator
+
+from .models import Video, format_duration
+
+SUMMARY_WORDS = 15
+
+
+class PlaylistEntry(namedtuple('PlaylistEntry', 'id order title duration summary')):
+    """
+    One video in a course playlist, with just what the lesson sidebar shows
+    """
+    __slots__ = ()
+
+    @property
+    def duration_display(self):
+        return format_duration(self.duration)
+
+
+def load_playlist(course_id):
+    """
+    The course's videos as PlaylistEntry tuples in order, from one query
+    """
+    rows = Video.objects.filter(course_id=course_id).order_by('order').values_list(
+        'id', 'order', 'title', 'duration', 'description'
+    )
+    return [
+        PlaylistEntry(video_id, order, title, duration, Truncator(description or '').words(SUMMARY_WORDS))
+        for video_id, order, title, duration, description in rows
+    ]
+
+
+def _version_key(course_id):
+    return f'playlist:version:{course_id}'
+
+
+def _current_version(course_id):
+    """
+    The course's playlist version in the shared cache. A missing (evicted)
+    version restarts from the clock rather than from 1, so it can never
+    land on the key of a playlist cached before the eviction.
+    """
+    version_key = _version_key(course_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def get_playlist(course_id):
+    """
+    The course playlist from the Django cache, loading it on a miss.
+
+    Entries are stored under the course's current version number, so
+    invalidating a playlist only bumps the version; a request that read the
+    old version while the change was being made can only write to the old
+    key, never overwrite the fresh playlist.
+    """
+    key = f'playlist:{course_id}:{_current_version(course_id)}'
+    playlist = cache.get(key)
+    if playlist is None:
+        playlist = load_playlist(course_id)
+        cache.set(key, playlist, settings.PLAYLIST_CACHE_TIMEOUT)
+    return playlist
+
+
+def _bump_version(course_id):
+    try:
+        cache.incr(_version_key(course_id))
+    except ValueError:
+        _current_version(course_id)
+
+
+def invalidate_playlist(course_id):
+    """
+    Drop the cached playlist of a course once the current transaction
+    commits (immediately outside a transaction)
+    """
+    transaction.on_commit(lambda: _bump_version(course_id))
+
+
+def locate(playlist, order):
+    """
+    Index of the entry with `order` in an ordered playlist, or None
+    """
+    index = bisect.bisect_left(playlist, order, key=attrgetter('order'))
+    if index < len(playlist) and playlist[index].order == order:
+        return index
+    return None
@@ -0,0 +1,160 @@
+import logging
+import os
+import struct
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .hls import segment_mp4
+from .jobs import enqueue, job_handler
+from .models import Course, Video
+from .playlist import invalidate_playlist
+from .mp4 import Mp4Error, extract_metadata, make_faststart, pack_seek_index
+from .storage import BLOB_DIR, blob_digest, get_video_storage, release_blob
+
+logger = logging.getLogger(__name__)
+
+
+def _repoint_video_file(video, name):
+    """
+    Point the Video at another stored file, handing it the blob reference
+    ingest took for `name` and releasing the old one. If the file was
+    replaced in the meantime, the reference to `name` is given back.
+    """
+    old_name = video.video_file.name
+    if name == old_name:
+        release_blob(name)
+        return False
+    with transaction.atomic():
+        if not Video.objects.filter(pk=video.pk, video_file=old_name).update(video_file=name):
+            release_blob(name)
+            return False
+        release_blob(old_name)
+    video.video_file.name = name
+    video._loaded_video_file = name
+    return True
+
+
+def apply_content_addressing(video):
+    """
+    Move a file that did not go through the blob store (a finished
+    resumable upload, or one stored before content addressing) into it,
+    so identical files share one copy
+    """
+    if not video.video_file or blob_digest(video.video_file.name):
+        return False
+    return _repoint_video_file(video, get_video_storage().ingest(video.video_file.path))
+
+
+def apply_faststart(video):
+    """
+    Move the moov atom of an uploaded MP4 in front of mdat and record the
+    result on the Video. Files that are not MP4 are left untouched.
+
+    A blob may be shared with other videos, so it is never rewritten in
+    place: the faststart copy becomes a blob of its own.
+    """
+    if not video.video_file:
+        return False
+
+    path = video.video_file.path
+    digest = blob_digest(video.video_file.name)
+    try:
+        if digest:
+            storage = get_video_storage()
+            output = storage.path(f'{BLOB_DIR}/incoming/{uuid.uuid4().hex}{os.path.splitext(path)[1]}')
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            if make_faststart(path, output):
+                _repoint_video_file(video, storage.ingest(output, source_digest=digest))
+        else:
+            make_faststart(path)
+        is_faststart = True
+    except (Mp4Error, OSError) as exc:
+        logger.warning('Faststart skipped for video %s: %s', video.pk, exc)
+        is_faststart = False
+
+    if is_faststart != video.is_faststart:
+        Video.objects.filter(pk=video.pk).update(is_faststart=is_faststart)
+        video.is_faststart = is_faststart
+    return is_faststart
+
+
+def apply_metadata(video):
+    """
+    Parse the MP4 container once and store duration, bitrate and the
+    keyframe seek index on the Video
+    """
+    if not video.video_file:
+        return False
+
+    try:
+        metadata = extract_metadata(video.video_file.path)
+    except (Mp4Error, OSError, struct.error) as exc:
+        logger.warning('Metadata extraction skipped for video %s: %s', video.pk, exc)
+        return False
+
+    video.duration = metadata['duration']
+    video.bitrate = metadata['bitrate']
+    video.seek_index = pack_seek_index(metadata['keyframes'])
+    with transaction.atomic():
+        # The change is taken from the locked row, not from the copy loaded
+        # when the job started: an overlapping job or a delete may have
+        # counted this video's duration since
+        stored = list(Video.objects.select_for_update().filter(pk=video.pk).values_list('duration', flat=True))
+        if not stored:
+            return False
+        duration_change = (video.duration or 0) - (stored[0] or 0)
+        Video.objects.filter(pk=video.pk).update(
+            duration=video.duration,
+            bitrate=video.bitrate,
+            seek_index=video.seek_index,
+        )
+        # Keep the course's stored total duration in step
+        if duration_change:
+            Course.objects.filter(pk=video.course_id).update(
+                total_duration=F('total_duration') + duration_change
+            )
+    # The playlist shows durations
+    invalidate_playlist(video.course_id)
+    return True
+
+
+@job_handler('segment_video')
+def apply_segmenting(video):
+    """
+    Split the video into fMP4 segments with an HLS playlist under
+    MEDIA_ROOT/segments/<id>/ and record the segment count
+    """
+    try:
+        count = segment_mp4(
+            video.video_file.path,
+            default_storage.path(video.segments_dir),
+            settings.VIDEO_SEGMENT_DURATION,
+        )
+    except (Mp4Error, OSError, struct.error) as exc:
+        logger.warning('Segmenting skipped for video %s: %s', video.pk, exc)
+        count = 0
+
+    Video.objects.filter(pk=video.pk).update(segment_count=count)
+    return count
+
+
+@job_handler('process_video')
+def process_uploaded_video(video):
+    """
+    Post-upload steps for a new or replaced video file, run as a background
+    job. The file is moved into the blob store first. Faststart runs before
+    metadata because it moves the chunk offsets the seek index records;
+    segmenting is queued as a job of its own.
+    """
+    apply_content_addressing(video)
+    apply_faststart(video)
+    apply_metadata(video)
+    if settings.VIDEO_SEGMENTING:
+        enqueue('segment_video', video)
+    elif video.segment_count:
+        # Segments of the previous file no longer match
+        Video.objects.filter(pk=video.pk).update(segment_count=0)
@@ -0,0 +1,109 @@
+import re
+
+from django.utils.http import parse_http_date_safe
+
+# Requests with more range specs than this are served as a plain 200
+MAX_RANGES = 100
+
+_RANGE_SPEC_RE = re.compile(r'^\s*([0-9]*)\s*-\s*([0-9]*)\s*$')
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    The Range header is valid but none of its ranges overlap the file
+    """
+
+
+def parse_range_header(header, size):
+    """
+    Parse a Range header against a file of `size` bytes.
+
+    Returns a sorted list of inclusive (start, end) tuples with overlapping
+    and adjacent ranges merged, or None if the header is missing, malformed
+    or not in bytes (the caller then serves the whole file). Raises
+    RangeNotSatisfiable if every range falls outside the file.
+    """
+    unit, sep, spec = (header or '').partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+
+    specs = spec.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    # A header with no range specs at all ("bytes=", "bytes=,") is invalid
+    if not any(part.strip() for part in specs):
+        return None
+
+    ranges = []
+    for part in specs:
+        if not part.strip():
+            continue
+        match = _RANGE_SPEC_RE.match(part)
+        if not match:
+            return None
+        first, last = match.groups()
+
+        if first:
+            # bytes=start- or bytes=start-end
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = int(last) if last else size - 1
+            if start >= size:
+                continue
+            ranges.append((start, min(end, size - 1)))
+        elif last:
+            # bytes=-suffix: the last `suffix` bytes of the file
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+        else:
+            return None
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    return coalesce_ranges(ranges)
+
+
+def is_open_ended(header):
+    """
+    True if the Range header is a single "bytes=start-" spec, asking for
+    everything from `start` to the end of the file rather than for a
+    closed range
+    """
+    unit, sep, spec = (header or '').partition('=')
+    if not sep or unit.strip().lower() != 'bytes' or ',' in spec:
+        return False
+    match = _RANGE_SPEC_RE.match(spec)
+    return bool(match and match.group(1) and not match.group(2))
+
+
+def coalesce_ranges(ranges):
+    """
+    Sort ranges and merge the ones that overlap or touch
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(if_range, etag, last_modified):
+    """
+    Evaluate an If-Range header against the current validators.
+
+    `last_modified` is a Unix timestamp. A missing header always matches;
+    entity tags use the strong comparison, so weak tags never match.
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    timestamp = parse_http_date_safe(if_range)
+    return timestamp is not None and timestamp == int(last_modified)
@@ -0,0 +1,128 @@
+import re
+
+from django.db import DatabaseError, connection
+
+COURSE_TABLE = 'LibraryApp_course'
+FTS_TABLE = 'LibraryApp_course_fts'
+PG_INDEX = 'LibraryApp_course_search_idx'
+
+# The Postgres query must use exactly the indexed expression for the GIN index to apply
+PG_DOCUMENT = (
+    "to_tsvector('english'::regconfig, "
+    "COALESCE(title, '') || ' ' || COALESCE(description, ''))"
+)
+
+
+# Copies courses into the FTS5 table; the index's DDL lives in migration 0010
+FTS_INSERT = (
+    f'INSERT INTO "{FTS_TABLE}" (rowid, title, description, instructor) '
+    f'SELECT c.id, c.title, c.description, u.username FROM "{COURSE_TABLE}" c '
+    'JOIN auth_user u ON u.id = c.instructor_id'
+)
+
+
+def rebuild_search_index():
+    """
+    Repopulate the SQLite FTS5 table from the course table (Postgres
+    indexes the expression itself, so nothing is needed there). Returns
+    the number of courses indexed, or None on other databases.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+        cursor.execute(FTS_INSERT)
+        return cursor.rowcount
+
+
+def index_course(course):
+    """
+    Insert or refresh a course in the SQLite FTS5 table (Postgres indexes
+    the expression itself, so nothing is needed there)
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [course.pk])
+        cursor.execute(f'{FTS_INSERT} WHERE c.id = %s', [course.pk])
+
+
+def unindex_course(course_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [course_id])
+
+
+def reindex_instructor(user):
+    """
+    Refresh the instructor name stored for every course taught by `user`
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE "{FTS_TABLE}" SET instructor = %s WHERE rowid IN '
+            f'(SELECT id FROM "{COURSE_TABLE}" WHERE instructor_id = %s)',
+            [user.username, user.pk]
+        )
+
+
+def _fts5_query(search_query):
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix
+    """
+    words = re.findall(r'\w+', search_query)
+    return ' '.join('"%s"*' % word.replace('"', '""') for word in words)
+
+
+def _tsquery(search_query):
+    """
+    The Postgres counterpart of _fts5_query, for to_tsquery
+    """
+    words = re.findall(r'\w+', search_query)
+    return ' & '.join("'%s':*" % word.replace("'", "''") for word in words)
+
+
+def search_course_ids(search_query, limit):
+    """
+    Return up to `limit` matching course ids, most relevant first, or None
+    if the database has no full-text index (the caller then falls back to
+    icontains filtering)
+    """
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                tsquery = _tsquery(search_query)
+                if not tsquery:
+                    return []
+                cursor.execute(
+                    'SELECT id FROM ('
+                    f'  SELECT c.id, ts_rank({PG_DOCUMENT}, q.query) AS rank'
+                    f'  FROM "{COURSE_TABLE}" c, to_tsquery(\'english\', %s) AS q(query)'
+                    f'  WHERE {PG_DOCUMENT} @@ q.query'
+                    '  UNION ALL'
+                    '  SELECT c.id, 0 AS rank'
+                    f'  FROM "{COURSE_TABLE}" c JOIN auth_user u ON u.id = c.instructor_id'
+                    '  WHERE u.username ILIKE %s'
+                    ') AS matches ORDER BY rank DESC, id LIMIT %s',
+                    [tsquery, search_query.replace('%', r'\%').replace('_', r'\_') + '%', limit]
+                )
+            elif connection.vendor == 'sqlite':
+                match = _fts5_query(search_query)
+                if not match:
+                    return []
+                cursor.execute(
+                    f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s '
+                    # Rank title matches first, then instructor, then description
+                    f'ORDER BY bm25("{FTS_TABLE}", 10.0, 1.0, 5.0), rowid LIMIT %s',
+                    [match, limit]
+                )
+            else:
+                return None
+            rows = cursor.fetchall()
+    except DatabaseError:
+        return None
+
+    # An id can appear twice on Postgres (text and instructor match); keep the first
+    return list(dict.fromkeys(row[0] for row in rows))
@@ -0,0 +1,167 @@
+import shutil
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import processing  # noqa: F401 (registers the job handlers)
+from .access import invalidate_course_access
+from .autocomplete import get_prefix_index
+from .jobs import enqueue
+from .models import Course, Enrollment, Video
+from .playlist import invalidate_playlist
+from .search import index_course, reindex_instructor, unindex_course
+from .storage import release_blob, retain_blob
+
+
+@receiver(post_init, sender=Video)
+def remember_video_file(sender, instance, **kwargs):
+    instance._loaded_video_file = instance.video_file.name
+
+
+@receiver(post_save, sender=Video)
+def process_saved_video(sender, instance, created, raw=False, **kwargs):
+    """
+    Queue post-upload processing, but only when the file is new or was
+    replaced, and move the blob reference counts from the old file to the
+    new one. The job row commits together with the video.
+
+    A file saved through the field already holds the reference the storage
+    took for it; only a name assigned directly is counted here.
+    """
+    if raw:
+        return
+    reference = instance.__dict__.pop('_blob_reference', None)
+    if not created and instance.video_file.name == instance._loaded_video_file:
+        # Same content saved again: the video already counts this blob
+        release_blob(reference)
+        return
+    if reference != instance.video_file.name:
+        retain_blob(instance.video_file.name)
+        release_blob(reference)
+    if not created:
+        release_blob(instance._loaded_video_file)
+    instance._loaded_video_file = instance.video_file.name
+    enqueue('process_video', instance)
+
+
+@receiver(post_delete, sender=Video)
+def release_video_blob(sender, instance, **kwargs):
+    release_blob(instance.video_file.name)
+
+
+@receiver(post_delete, sender=Video)
+def remove_video_segments(sender, instance, **kwargs):
+    """
+    Remove the HLS segments generated for a deleted video
+    """
+    if instance.segment_count:
+        segments_path = default_storage.path(instance.segments_dir)
+        transaction.on_commit(lambda: shutil.rmtree(segments_path, ignore_errors=True))
+
+
+@receiver(post_save, sender=Course)
+def index_saved_course(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_course(instance)
+        get_prefix_index().update_course(instance)
+
+
+@receiver(post_delete, sender=Course)
+def unindex_deleted_course(sender, instance, **kwargs):
+    unindex_course(instance.pk)
+    get_prefix_index().remove_course(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def reindex_renamed_instructor(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Keep the instructor name in the search index in step with the username
+    """
+    if raw or created:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    reindex_instructor(instance)
+    get_prefix_index().rename_instructor(instance)
+
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def invalidate_course_playlist(sender, instance, **kwargs):
+    invalidate_playlist(instance.course_id)
+
+
+@receiver(post_init, sender=Course)
+def remember_course_instructor(sender, instance, **kwargs):
+    # Read __dict__ so a deferred field is not fetched
+    instance._loaded_instructor_id = instance.__dict__.get('instructor_id')
+
+
+@receiver(post_save, sender=Course)
+def invalidate_instructor_access(sender, instance, created, raw=False, **kwargs):
+    """
+    A new course, or one handed to another instructor, changes what its
+    old and new instructors may manage
+    """
+    if raw:
+        return
+    if created or instance.instructor_id != instance._loaded_instructor_id:
+        invalidate_course_access(instance.instructor_id)
+        if instance._loaded_instructor_id is not None:
+            invalidate_course_access(instance._loaded_instructor_id)
+        instance._loaded_instructor_id = instance.instructor_id
+
+
+@receiver(post_delete, sender=Course)
+def invalidate_deleted_course_access(sender, instance, **kwargs):
+    invalidate_course_access(instance.instructor_id)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrollment_access(sender, instance, **kwargs):
+    invalidate_course_access(instance.user_id)
+
+
+@receiver(post_save, sender=Video)
+def count_added_video(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Course.objects.filter(pk=instance.course_id).update(
+            video_count=F('video_count') + 1,
+            total_duration=F('total_duration') + (instance.duration or 0),
+        )
+
+
+@receiver(pre_delete, sender=Video)
+def lock_deleted_video(sender, instance, **kwargs):
+    """
+    Re-read the duration with the row locked, so the course total loses
+    what was counted for this video, even if a metadata job stored it
+    after the instance was loaded
+    """
+    stored = list(Video.objects.select_for_update().filter(pk=instance.pk).values_list('duration', flat=True))
+    if stored:
+        instance.duration = stored[0]
+
+
+@receiver(post_delete, sender=Video)
+def count_deleted_video(sender, instance, **kwargs):
+    Course.objects.filter(pk=instance.course_id).update(
+        video_count=F('video_count') - 1,
+        total_duration=F('total_duration') - (instance.duration or 0),
+    )
+
+
+@receiver(post_save, sender=Enrollment)
+def count_added_enrollment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Course.objects.filter(pk=instance.course_id).update(enrollment_count=F('enrollment_count') + 1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def count_deleted_enrollment(sender, instance, **kwargs):
+    Course.objects.filter(pk=instance.course_id).update(enrollment_count=F('enrollment_count') - 1)
@@ -0,0 +1,272 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.fields.files import FieldFile
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'course_videos'
+BLOB_NAME_RE = re.compile(r'^course_videos/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?$')
+HASH_READ_SIZE = 1024 * 1024
+
+
+def shard_dirs(key, depth=2, width=2):
+    """
+    Nested directory path made of the leading characters of `key`:
+    shard_dirs('abcdef') == 'ab/cd'
+    """
+    return '/'.join(key[i * width:(i + 1) * width] for i in range(depth))
+
+
+def shard_path(key, depth=2, width=2):
+    """
+    Spread names over nested directories by the leading characters of
+    `key`: shard_path('abcdef') == 'ab/cd/abcdef'
+    """
+    return f'{shard_dirs(key, depth, width)}/{key}'
+
+
+@deconstructible
+class ShardedUploadTo:
+    """
+    upload_to that spreads files over nested directories under `prefix`
+    instead of one flat directory, keeping the file name and using a
+    random hex key for the directories, e.g. thumbnails/3f/a2/intro.png.
+
+    The shard is not derived from the row: the primary key is not assigned
+    yet when a new instance's file is saved, and hashing the file name
+    would put every intro.png in one directory. The directory cannot be
+    computed back from an instance; it is only known from the stored name,
+    which FileField keeps anyway.
+    """
+
+    def __init__(self, prefix, depth=2):
+        self.prefix = prefix.rstrip('/')
+        self.depth = depth
+
+    def __call__(self, instance, filename):
+        return f'{self.prefix}/{shard_dirs(uuid.uuid4().hex, self.depth)}/{os.path.basename(filename)}'
+
+    def is_sharded(self, name):
+        """
+        Whether `name` already sits in a shard directory under the prefix
+        """
+        return bool(re.match(rf'^{re.escape(self.prefix)}/(\w{{2}}/){{{self.depth}}}[^/]+$', name or ''))
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ShardedUploadTo)
+            and (self.prefix, self.depth) == (other.prefix, other.depth)
+        )
+
+
+def blob_name(digest, ext=''):
+    return f'{BLOB_DIR}/{shard_path(digest)}{ext.lower()}'
+
+
+def blob_digest(name):
+    """
+    The SHA-256 a blob name was derived from, or None for other names
+    (files stored before content addressing, staged resumable uploads)
+    """
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+def hash_file(file):
+    """
+    SHA-256 hex digest of a file object, read from the start in fixed-size
+    blocks
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(HASH_READ_SIZE), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools an upload to a temporary file like Django's default handler and
+    computes its SHA-256 on the way, so storing it needs no second read
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every distinct file once, under course_videos/ab/cd/<sha256><ext>.
+    Saving content that is already stored (or that processing turned into
+    a stored blob) writes nothing and returns the existing name. A MediaBlob
+    row per file counts the videos using it; see retain_blob/release_blob.
+
+    _save and ingest take one reference on the blob they return, for the
+    caller to hand to a Video (see BlobFieldFile) or give back with
+    release_blob.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save
+        return name
+
+    def _take_reference(self, digest, staged=None, source_digest=None):
+        """
+        Count one more reference on the blob with content `digest` and
+        return its name. The blob row stays locked from the lookup to the
+        increment, so delete_unused_blob cannot remove the file in between.
+
+        If the content is not stored yet, the file at `staged` (a path
+        inside MEDIA_ROOT) is moved into place as a new blob; without
+        `staged`, None is returned. A `staged` file that turns out to be
+        a duplicate is removed.
+        """
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            blob = (
+                MediaBlob.objects.select_for_update()
+                .filter(Q(sha256=digest) | Q(source_sha256=digest)).order_by('-ref_count').first()
+            )
+            if blob is not None and self.exists(blob.name):
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                if staged is not None:
+                    os.remove(staged)
+                return blob.name
+            if staged is None:
+                return None
+
+            name = blob_name(digest, os.path.splitext(staged)[1])
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                sha256=digest,
+                defaults={
+                    'name': name,
+                    'size': os.path.getsize(staged),
+                    'source_sha256': source_digest,
+                    'ref_count': 1,
+                },
+            )
+            if not created:
+                # The row outlived its file; store the file again
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+            os.makedirs(os.path.dirname(self.path(blob.name)), exist_ok=True)
+            os.replace(staged, self.path(blob.name))
+            return blob.name
+
+    def _save(self, name, content):
+        digest = getattr(content, 'sha256', None) or hash_file(content)
+        existing = self._take_reference(digest)
+        if existing is not None:
+            return existing
+
+        # Write under a unique name first; only the rename into place
+        # happens with the blob row locked
+        staged = super()._save(f'{BLOB_DIR}/incoming/{uuid.uuid4().hex}{os.path.splitext(name)[1]}', content)
+        return self._take_reference(digest, self.path(staged))
+
+    def ingest(self, path, source_digest=None):
+        """
+        Move the file at `path` (inside MEDIA_ROOT) into the blob store and
+        return its blob name, with a reference taken for the caller. If the
+        content is already stored, the file is deleted instead.
+        `source_digest` records the blob it was derived from, so a later
+        upload of that source maps to this blob.
+        """
+        from .models import MediaBlob
+
+        with open(path, 'rb') as file:
+            digest = hash_file(file)
+        name = self._take_reference(digest, path, source_digest)
+        if source_digest and source_digest != digest:
+            MediaBlob.objects.filter(sha256=digest, source_sha256__isnull=True).update(source_sha256=source_digest)
+        return name
+
+
+class BlobFieldFile(FieldFile):
+    """
+    FieldFile for ContentAddressedStorage. Saving content leaves the name
+    of the blob reference the storage took in instance._blob_reference,
+    for the post_save signal to take over instead of counting the blob
+    again. With save=True, a failing save rolls the reference back.
+    """
+
+    def save(self, name, content, save=True):
+        with transaction.atomic():
+            super().save(name, content, save=False)
+            self.instance._blob_reference = self.name
+            if save:
+                self.instance.save()
+
+
+class BlobFileField(models.FileField):
+    attr_class = BlobFieldFile
+
+
+_video_storage = None
+
+
+def get_video_storage():
+    global _video_storage
+    if _video_storage is None:
+        _video_storage = ContentAddressedStorage()
+    return _video_storage
+
+
+def retain_blob(name):
+    """
+    Count one more video using the blob `name`. Other names are ignored.
+    """
+    from .models import MediaBlob
+
+    digest = blob_digest(name)
+    if digest:
+        MediaBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(name):
+    """
+    Count one video fewer using the blob `name`; once nothing uses it, the
+    row and file are deleted after the transaction commits
+    """
+    from .models import MediaBlob
+
+    digest = blob_digest(name)
+    if not digest:
+        return
+    MediaBlob.objects.filter(sha256=digest, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: delete_unused_blob(digest))
+
+
+def delete_unused_blob(digest):
+    """
+    Delete the blob with `digest` and its file if no video uses it. The file
+    is removed while the row is locked, so a concurrent save either takes
+    its reference first (and the blob stays) or stores the file anew.
+    Returns whether the blob was deleted.
+    """
+    from .models import MediaBlob
+
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(sha256=digest, ref_count=0).first()
+        if blob is None:
+            return False
+        blob.delete()
+        get_video_storage().delete(blob.name)
+    return True
@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Video
+
+STREAM_TOKEN_SALT = 'LibraryApp.stream_tokens'
+
+
+def _session_binding(session_key):
+    """
+    Short HMAC of the session key, so a token only works alongside the
+    session cookie it was minted for
+    """
+    return salted_hmac(STREAM_TOKEN_SALT, session_key).hexdigest()[:16]
+
+
+def make_stream_url(request, video):
+    """
+    Return a signed, expiring URL for streaming `video` as request.user.
+    Call only after the enrollment/instructor check has passed.
+
+    The expiry is rounded down to a quarter of VIDEO_STREAM_URL_MAX_AGE so
+    page views inside the same window get the same URL and can reuse the
+    browser's cached ranges.
+    """
+    max_age = settings.VIDEO_STREAM_URL_MAX_AGE
+    window = max(max_age // 4, 1)
+    expires = int(time.time()) // window * window + max_age
+
+    payload = {
+        'v': video.id,
+        'u': request.user.id,
+        'f': video.video_file.name,
+        's': _session_binding(request.session.session_key or ''),
+        'e': expires,
+    }
+    token = signing.Signer(salt=STREAM_TOKEN_SALT).sign_object(payload, compress=True)
+    return reverse('serve_signed_video', args=[token])
+
+
+def read_stream_token(request, token):
+    """
+    Validate a token from make_stream_url using only the signature, the
+    expiry and the session cookie. Returns the payload, or None if the
+    token is forged, expired or belongs to another session.
+    """
+    try:
+        payload = signing.Signer(salt=STREAM_TOKEN_SALT).unsign_object(token)
+    except signing.BadSignature:
+        return None
+
+    if payload['e'] < time.time():
+        return None
+
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session_key or not constant_time_compare(payload['s'], _session_binding(session_key)):
+        return None
+
+    return payload
+
+
+def token_video_file(payload):
+    """
+    Build the Video.video_file FieldFile named in a token without a query
+    """
+    field = Video._meta.get_field('video_file')
+    return field.attr_class(None, field, payload['f'])
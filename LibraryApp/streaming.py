@@ -0,0 +1,395 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date
+
+from .blockcache import get_block_cache
+from .ranges import parse_range_header, if_range_matches, is_open_ended, RangeNotSatisfiable
+from .storage import blob_digest
+
+
+class StoredFile:
+    """
+    Minimal stand-in for a FieldFile: a storage name and its local path
+    """
+
+    def __init__(self, name, storage=default_storage):
+        self.name = name
+        self.path = storage.path(name)
+
+
+class RangeFileWrapper:
+    """
+    File-like view over `length` bytes of an open file starting at `start`.
+    It exposes fileno() so servers with wsgi.file_wrapper (gunicorn) can use
+    os.sendfile for the range; read() is bounded for plain iteration.
+    """
+
+    def __init__(self, filelike, start, length):
+        self.filelike = filelike
+        self.remaining = length
+        filelike.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.filelike.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.filelike.fileno()
+
+    def close(self):
+        self.filelike.close()
+
+
+class RangedFileResponse(FileResponse):
+    """
+    FileResponse for `length` bytes of the file at `path` starting at `start`.
+    Under gunicorn the body is sent with os.sendfile (offset = start,
+    count = Content-Length); elsewhere it is read in `block_size` chunks.
+    """
+
+    def __init__(self, path, start=0, length=None, block_size=None, **kwargs):
+        self.block_size = block_size or settings.VIDEO_STREAM_CHUNK_SIZE
+        filelike = open(path, 'rb')
+        if length is None:
+            length = os.fstat(filelike.fileno()).st_size - start
+        super().__init__(RangeFileWrapper(filelike, start, length), **kwargs)
+        self['Content-Length'] = str(length)
+
+
+_read_executor = None
+
+
+def _get_read_executor():
+    """
+    Shared thread pool for async file reads, bounded by VIDEO_ASYNC_READ_WORKERS
+    so a burst of viewers cannot exhaust the default executor
+    """
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(
+            max_workers=settings.VIDEO_ASYNC_READ_WORKERS,
+            thread_name_prefix='video-read'
+        )
+    return _read_executor
+
+
+async def run_in_read_executor(func, *args):
+    """
+    Run a blocking file-system call from async code in the bounded read
+    executor, so it does not stall the event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(_get_read_executor(), func, *args)
+
+
+async def _aiter_file_range(path, start, length, block_size):
+    """
+    Async generator over `length` bytes of `path` from `start`. Reads run in
+    the bounded executor. Only one chunk is read ahead: the ASGI server's
+    `await send()` blocks until the client drains it, which gives
+    backpressure.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_read_executor()
+    file_object = await loop.run_in_executor(executor, open, path, 'rb')
+    try:
+        await loop.run_in_executor(executor, file_object.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await loop.run_in_executor(executor, file_object.read, min(block_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_object.close()
+
+
+def file_range_response(path, start, length, content_type, status=200, asynchronous=False):
+    """
+    Response for `length` bytes of `path` from `start`. Under ASGI the body
+    is an async iterator, because Django reads a sync iterator into memory
+    in full before sending it.
+    """
+    if not asynchronous:
+        return RangedFileResponse(path, start=start, length=length, status=status, content_type=content_type)
+
+    response = StreamingHttpResponse(
+        _aiter_file_range(path, start, length, settings.VIDEO_STREAM_CHUNK_SIZE),
+        status=status,
+        content_type=content_type
+    )
+    response['Content-Length'] = str(length)
+    return response
+
+
+def _read_cached_piece(cache, key, path, file_size, block, start, end, handle):
+    """
+    Return the part of `block` that falls in [start, end]. Hot blocks come
+    from (or are added to) the block cache; other blocks are read directly.
+    `handle` is a one-item list holding a lazily opened file, so cache hits
+    never touch the disk.
+    """
+    block_size = cache.block_size
+    block_start = block * block_size
+    lo = max(start, block_start)
+    hi = min(end, block_start + block_size - 1)
+
+    if cache.is_hot(block_start, file_size):
+        data = cache.get(key + (block,))
+        if data is None:
+            if handle[0] is None:
+                handle[0] = open(path, 'rb')
+            handle[0].seek(block_start)
+            data = handle[0].read(block_size)
+            cache.put(key + (block,), data)
+        return data[lo - block_start:hi - block_start + 1]
+
+    if handle[0] is None:
+        handle[0] = open(path, 'rb')
+    handle[0].seek(lo)
+    return handle[0].read(hi - lo + 1)
+
+
+def _cached_range(cache, key, path, file_size, start, end):
+    handle = [None]
+    try:
+        for block in range(start // cache.block_size, end // cache.block_size + 1):
+            yield _read_cached_piece(cache, key, path, file_size, block, start, end, handle)
+    finally:
+        if handle[0] is not None:
+            handle[0].close()
+
+
+async def _acached_range(cache, key, path, file_size, start, end):
+    loop = asyncio.get_running_loop()
+    executor = _get_read_executor()
+    handle = [None]
+    try:
+        for block in range(start // cache.block_size, end // cache.block_size + 1):
+            yield await loop.run_in_executor(
+                executor, _read_cached_piece, cache, key, path, file_size, block, start, end, handle
+            )
+    finally:
+        if handle[0] is not None:
+            handle[0].close()
+
+
+def cached_range_response(cache, key, path, file_size, start, end, content_type, status=200, asynchronous=False):
+    """
+    Response for bytes [start, end] of `path` read through the block cache.
+    `key` identifies the file version, e.g. (name, etag).
+    """
+    body = _acached_range if asynchronous else _cached_range
+    response = StreamingHttpResponse(
+        body(cache, key, path, file_size, start, end),
+        status=status,
+        content_type=content_type
+    )
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def file_validators(stat, name=None):
+    """
+    Return (ETag, Last-Modified) header values built from an os.stat result.
+    A content-addressed blob's hash is used as a strong ETag.
+    """
+    digest = blob_digest(name)
+    etag = f'"{digest}"' if digest else f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    return etag, http_date(stat.st_mtime)
+
+
+def _multipart_byteranges(path, parts, block_size):
+    """
+    Yield a multipart/byteranges body; `parts` is a list of
+    (part header bytes, start, end) and ends with the closing boundary.
+    """
+    with open(path, 'rb') as file_object:
+        for head, start, end in parts:
+            yield head
+            if start is None:
+                continue
+            file_object.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file_object.read(min(block_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            yield b'\r\n'
+
+
+async def _amultipart_byteranges(path, parts, block_size):
+    """
+    Async counterpart of _multipart_byteranges
+    """
+    for head, start, end in parts:
+        yield head
+        if start is None:
+            continue
+        async for chunk in _aiter_file_range(path, start, end - start + 1, block_size):
+            yield chunk
+        yield b'\r\n'
+
+
+def multipart_range_response(path, ranges, file_size, content_type, asynchronous=False):
+    """
+    206 response carrying several byte ranges as multipart/byteranges
+    """
+    boundary = get_random_string(32)
+    parts = []
+    content_length = 0
+    for start, end in ranges:
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+        ).encode('ascii')
+        parts.append((head, start, end))
+        content_length += len(head) + (end - start + 1) + 2
+    closing = f'--{boundary}--\r\n'.encode('ascii')
+    parts.append((closing, None, None))
+    content_length += len(closing)
+
+    body = _amultipart_byteranges if asynchronous else _multipart_byteranges
+    response = StreamingHttpResponse(
+        body(path, parts, settings.VIDEO_STREAM_CHUNK_SIZE),
+        status=206,
+        content_type=f'multipart/byteranges; boundary={boundary}'
+    )
+    response['Content-Length'] = str(content_length)
+    return response
+
+
+def python_delivery(request, video_file, content_type):
+    """
+    Stream the file from the Django worker (the default backend)
+    """
+    video_path = video_file.path
+    asynchronous = isinstance(request, ASGIRequest)
+    stat = os.stat(video_path)
+    file_size = stat.st_size
+    etag, last_modified = file_validators(stat, video_file.name)
+
+    # Unchanged content is answered with 304 (or 412 for a failed If-Match)
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        conditional['ETag'] = etag
+        conditional['Last-Modified'] = last_modified
+        return conditional
+
+    # Range is ignored when If-Range names an older version of the file
+    ranges = None
+    range_header = request.META.get('HTTP_RANGE', '').strip()
+    if range_header and if_range_matches(request.META.get('HTTP_IF_RANGE'), etag, stat.st_mtime):
+        try:
+            ranges = parse_range_header(range_header, file_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{file_size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    if ranges and len(ranges) > 1:
+        response = multipart_range_response(
+            video_path, ranges, file_size, content_type, asynchronous=asynchronous
+        )
+
+    else:
+        # Full content (200) or a single range for video seeking (206)
+        start, end = ranges[0] if ranges else (0, file_size - 1)
+        status = 206 if ranges else 200
+
+        # Ranges that lie within a hot zone of the file go through the block
+        # cache; everything else keeps the sendfile path
+        cache = get_block_cache()
+        if cache is not None and ranges and start < cache.hot_bytes <= end and is_open_ended(range_header):
+            # A player's opening "bytes=0-" gets the cached head only, and
+            # asks for the rest with further range requests; an explicit
+            # "first-last" range is always served in full
+            end = cache.hot_bytes - 1
+        if cache is not None and file_size and cache.covers(start, end, file_size):
+            response = cached_range_response(
+                cache,
+                (video_file.name, etag),
+                video_path,
+                file_size,
+                start,
+                end,
+                content_type,
+                status=status,
+                asynchronous=asynchronous
+            )
+        else:
+            response = file_range_response(
+                video_path,
+                start,
+                end - start + 1,
+                content_type,
+                status=status,
+                asynchronous=asynchronous
+            )
+
+        if ranges:
+            response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return response
+
+
+def nginx_delivery(request, video_file, content_type):
+    """
+    Hand the transfer to nginx through an X-Accel-Redirect to an internal location.
+    nginx re-applies the client's Range header itself, so full and ranged
+    requests get the same (empty) response from Django.
+    """
+    response = HttpResponse(content_type=content_type)
+    prefix = settings.VIDEO_ACCEL_REDIRECT_PREFIX.rstrip('/')
+    response['X-Accel-Redirect'] = f'{prefix}/{quote(video_file.name)}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def sendfile_delivery(request, video_file, content_type):
+    """
+    Hand the transfer to Apache (mod_xsendfile) or lighttpd through X-Sendfile
+    """
+    response = HttpResponse(content_type=content_type)
+    response['X-Sendfile'] = video_file.path
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+DELIVERY_BACKENDS = {
+    'python': python_delivery,
+    'nginx': nginx_delivery,
+    'sendfile': sendfile_delivery,
+}
+
+
+def get_delivery_backend():
+    """
+    Return the delivery function selected by settings.VIDEO_DELIVERY_BACKEND
+    """
+    name = getattr(settings, 'VIDEO_DELIVERY_BACKEND', 'python')
+    try:
+        return DELIVERY_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown VIDEO_DELIVERY_BACKEND "{name}"')
@@ -1,3 +1,1140 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import access
+from .autocomplete import CHANGE_CACHE_KEY, VERSION_CACHE_KEY, PrefixIndex
+from .jobs import claim_jobs, renew_leases
+from .models import Course, Enrollment, Job, MediaBlob, Video, VideoUpload
+from .mp4 import (
+    extract_metadata, find_box, is_faststart, make_faststart, pack_seek_index, read_moov,
+    top_level_boxes, track_samples, unpack_seek_index,
+)
+from .playlist import get_playlist
+from .processing import apply_metadata, apply_segmenting
+from .search import FTS_TABLE, search_course_ids
+from .blockcache import BlockCache
+from .ranges import RangeNotSatisfiable, is_open_ended, parse_range_header
+from .storage import ContentAddressedStorage, blob_digest, get_video_storage
+from .uploads import UploadError, append_chunk, create_upload
+
+
+def mp4_box(box_type, body, version=None):
+    """
+    Serialize a box; full boxes (with `version`) get a version/flags word
+    """
+    if version is not None:
+        body = struct.pack('>I', version << 24) + body
+    return struct.pack('>I4s', len(body) + 8, box_type) + body
+
+
+def build_mp4(samples, keyframes=None, timescale=1000, sample_duration=500, samples_per_chunk=2,
+              moov_last=True, co64=False):
+    """
+    A minimal MP4 with one video track holding `samples` (bytes each),
+    `samples_per_chunk` to a chunk. `keyframes` lists the 1-based sync
+    sample numbers; without it every sample is a sync sample.
+    """
+    ftyp = mp4_box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isommp41')
+    mdat = mp4_box(b'mdat', b''.join(samples))
+    duration = len(samples) * sample_duration
+
+    def moov(mdat_offset):
+        offsets = []
+        position = mdat_offset + 8
+        for number, sample in enumerate(samples):
+            if number % samples_per_chunk == 0:
+                offsets.append(position)
+            position += len(sample)
+        count = len(offsets)
+        stbl = [
+            mp4_box(b'stsd', struct.pack('>I', 0), version=0),
+            mp4_box(b'stts', struct.pack('>III', 1, len(samples), sample_duration), version=0),
+            mp4_box(b'stsc', struct.pack('>IIII', 1, 1, samples_per_chunk, 1), version=0),
+            mp4_box(b'stsz', struct.pack('>II%dI' % len(samples), 0, len(samples), *map(len, samples)), version=0),
+            mp4_box(b'co64', struct.pack('>I%dQ' % count, count, *offsets), version=0) if co64 else
+            mp4_box(b'stco', struct.pack('>I%dI' % count, count, *offsets), version=0),
+        ]
+        if keyframes is not None:
+            stbl.append(mp4_box(b'stss', struct.pack('>I%dI' % len(keyframes), len(keyframes), *keyframes), version=0))
+        mdia = (
+            mp4_box(b'mdhd', struct.pack('>IIII', 0, 0, timescale, duration) + bytes(4), version=0)
+            + mp4_box(b'hdlr', struct.pack('>I4s', 0, b'vide') + bytes(13), version=0)
+            + mp4_box(b'minf', mp4_box(b'stbl', b''.join(stbl)))
+        )
+        trak = mp4_box(b'tkhd', struct.pack('>IIIII', 0, 0, 1, 0, duration) + bytes(60), version=0) + mp4_box(b'mdia', mdia)
+        mvhd = mp4_box(b'mvhd', struct.pack('>IIII', 0, 0, timescale, duration) + bytes(80), version=0)
+        return mp4_box(b'moov', mvhd + mp4_box(b'trak', trak))
+
+    if moov_last:
+        return ftyp + mdat + moov(len(ftyp))
+    return ftyp + moov(len(ftyp) + len(moov(0))) + mdat
+
+
+class MediaTestCase(TestCase):
+    """
+    Test case with MEDIA_ROOT in a temporary directory, a course taught by
+    `instructor`, one video in it and an enrolled `student`
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user('instructor', password='pw')
+        cls.student = User.objects.create_user('student', password='pw')
+        cls.course = cls.create_course('Course 1')
+        cls.video_data = bytes(range(256)) * 64
+        cls.video = cls.create_video(cls.course, 1, cls.video_data)
+        Enrollment.objects.create(user=cls.student, course=cls.course)
+
+    @classmethod
+    def create_course(cls, title):
+        course = Course(title=title, description='About ' + title, instructor=cls.instructor)
+        course.thumbnail.save('thumb.png', ContentFile(b'png'), save=False)
+        course.save()
+        return course
+
+    @classmethod
+    def create_video(cls, course, order, data=b'video'):
+        video = Video(title=f'Lesson {order}', course=course, order=order)
+        video.video_file.save(f'lesson{order}.mp4', ContentFile(data), save=False)
+        video.save()
+        return video
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+
+class DeliveryBackendTests(MediaTestCase):
+    """
+    serve_video hands the transfer to the front-end server with an empty
+    response for full and ranged requests alike
+    """
+
+    def stream(self, **headers):
+        return self.client.get(f'/video/stream/{self.video.id}/', **headers)
+
+    @override_settings(VIDEO_DELIVERY_BACKEND='nginx', VIDEO_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_nginx_full_and_ranged(self):
+        for headers in ({}, {'HTTP_RANGE': 'bytes=100-199'}):
+            response = self.stream(**headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.video.video_file.name}')
+            self.assertEqual(response['Accept-Ranges'], 'bytes')
+            self.assertEqual(response.content, b'')
+
+    @override_settings(VIDEO_DELIVERY_BACKEND='sendfile')
+    def test_sendfile_full_and_ranged(self):
+        for headers in ({}, {'HTTP_RANGE': 'bytes=100-199'}):
+            response = self.stream(**headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Sendfile'], self.video.video_file.path)
+            self.assertEqual(response.content, b'')
+
+    @override_settings(VIDEO_DELIVERY_BACKEND='python')
+    def test_python_full_and_ranged(self):
+        response = self.stream()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.video_data)
+
+        response = self.stream(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.video_data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.video_data[100:200])
+
+    @override_settings(VIDEO_DELIVERY_BACKEND='nginx')
+    def test_no_headers_without_access(self):
+        outsider = User.objects.create_user('outsider', password='pw')
+        self.client.force_login(outsider)
+        response = self.stream()
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+
+class RangeHeaderTests(SimpleTestCase):
+    def test_invalid_headers_are_ignored(self):
+        for header in ('bytes=', 'bytes=,', 'bytes= , ', 'items=0-1', 'bytes=5-2', 'bytes=a-b'):
+            self.assertIsNone(parse_range_header(header, 100), header)
+
+    def test_ranges_are_merged(self):
+        self.assertEqual(parse_range_header('bytes=0-9,5-19,-10', 100), [(0, 19), (90, 99)])
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=100-', 100)
+
+    def test_open_ended(self):
+        self.assertTrue(is_open_ended('bytes=0-'))
+        self.assertTrue(is_open_ended('bytes= 100 - '))
+        for header in ('bytes=0-99', 'bytes=-100', 'bytes=0-,200-', 'items=0-', ''):
+            self.assertFalse(is_open_ended(header), header)
+
+
+@override_settings(VIDEO_DELIVERY_BACKEND='python')
+class ConditionalGetTests(MediaTestCase):
+    """
+    The python backend answers validators with 304/412 and ignores Range
+    when If-Range names another version of the file
+    """
+
+    def setUp(self):
+        super().setUp()
+        response = self.stream()
+        self.etag, self.last_modified = response['ETag'], response['Last-Modified']
+
+    def stream(self, **headers):
+        return self.client.get(f'/video/stream/{self.video.id}/', **headers)
+
+    def test_not_modified(self):
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': self.etag},
+            {'HTTP_IF_NONE_MATCH': f'"other", {self.etag}'},
+            {'HTTP_IF_MODIFIED_SINCE': self.last_modified},
+        ):
+            response = self.stream(HTTP_RANGE='bytes=0-99', **headers)
+            self.assertEqual(response.status_code, 304, headers)
+            self.assertEqual(response['ETag'], self.etag)
+            self.assertEqual(response.content, b'')
+
+        response = self.stream(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.video_data)
+
+    def test_if_match(self):
+        response = self.stream(HTTP_IF_MATCH='"other"', HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.stream(HTTP_IF_MATCH=self.etag, HTTP_RANGE='bytes=0-99').status_code, 206)
+
+    def test_if_range(self):
+        for if_range in (self.etag, self.last_modified):
+            response = self.stream(HTTP_RANGE='bytes=100-199', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 206, if_range)
+            self.assertEqual(b''.join(response.streaming_content), self.video_data[100:200])
+
+        # A changed file, a weak tag or an older date get the whole file
+        for if_range in ('"other"', f'W/{self.etag}', 'Mon, 01 Jan 2001 00:00:00 GMT'):
+            response = self.stream(HTTP_RANGE='bytes=100-199', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 200, if_range)
+            self.assertNotIn('Content-Range', response)
+            self.assertEqual(b''.join(response.streaming_content), self.video_data)
+
+
+@override_settings(VIDEO_DELIVERY_BACKEND='python', VIDEO_STREAM_CHUNK_SIZE=1000, VIDEO_BLOCK_CACHE_BACKEND='')
+class AsyncStreamTests(MediaTestCase):
+    """
+    serve_video_async streams the file as an async iterator, one chunk read
+    at a time in the bounded read executor
+    """
+
+    async def stream(self, **headers):
+        await self.async_client.aforce_login(self.student)
+        return await self.async_client.get(f'/video/stream/{self.video.id}/async/', **headers)
+
+    async def body(self, response):
+        self.assertTrue(response.is_async)
+        return [chunk async for chunk in response.streaming_content]
+
+    async def test_full_and_ranged(self):
+        response = await self.stream()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(await self.body(response)), self.video_data)
+
+        response = await self.stream(headers={'Range': 'bytes=100-2599'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-2599/{len(self.video_data)}')
+        self.assertEqual(response['Content-Length'], '2500')
+        chunks = await self.body(response)
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+        self.assertEqual(b''.join(chunks), self.video_data[100:2600])
+
+    async def test_file_checks_run_off_the_event_loop(self):
+        exists = os.path.exists
+        threads = []
+
+        def record_thread(path):
+            threads.append(threading.current_thread())
+            return exists(path)
+
+        with mock.patch('LibraryApp.views.os.path.exists', record_thread):
+            response = await self.stream(headers={'Range': 'bytes=0-99'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].name.startswith('video-read'))
+
+    async def test_no_access(self):
+        await self.async_client.aforce_login(await User.objects.acreate_user('outsider', password='pw'))
+        response = await self.async_client.get(f'/video/stream/{self.video.id}/async/')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(VIDEO_DELIVERY_BACKEND='python')
+class BlockCacheTests(MediaTestCase):
+    """
+    The 16 KiB test video against a cache with 1 KiB blocks and 4 KiB hot
+    zones at each end
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.cache = BlockCache(max_bytes=64 * 1024, block_size=1024, hot_bytes=4096)
+        patcher = mock.patch('LibraryApp.streaming.get_block_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, header):
+        response = self.client.get(f'/video/stream/{self.video.id}/', HTTP_RANGE=header)
+        self.assertEqual(response.status_code, 206)
+        return response, b''.join(response.streaming_content)
+
+    def test_head_is_cached(self):
+        response, body = self.fetch('bytes=1000-2999')
+        self.assertEqual(body, self.video_data[1000:3000])
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 3))
+
+        response, body = self.fetch('bytes=1500-2499')
+        self.assertEqual(body, self.video_data[1500:2500])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 3))
+
+    def test_tail_is_cached(self):
+        response, body = self.fetch('bytes=-100')
+        self.assertEqual(response['Content-Range'], 'bytes 16284-16383/16384')
+        self.assertEqual(body, self.video_data[-100:])
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_range_crossing_into_cold_zone_bypasses_cache(self):
+        response, body = self.fetch('bytes=3000-6000')
+        self.assertEqual(body, self.video_data[3000:6001])
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_open_ended_range_gets_the_cached_head(self):
+        for header, start in (('bytes=0-', 0), ('bytes=100-', 100)):
+            response, body = self.fetch(header)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-4095/16384')
+            self.assertEqual(body, self.video_data[start:4096])
+
+    def test_explicit_range_to_the_end_is_served_in_full(self):
+        response, body = self.fetch('bytes=0-16383')
+        self.assertEqual(response['Content-Range'], 'bytes 0-16383/16384')
+        self.assertEqual(body, self.video_data)
+
+    def test_eviction_keeps_memory_ceiling(self):
+        cache = BlockCache(max_bytes=2048, block_size=1024, hot_bytes=4096)
+        for index in range(3):
+            cache.put(('name', 'etag', index), b'x' * 1024)
+        self.assertEqual((cache.size, cache.evictions), (2048, 1))
+        self.assertIsNone(cache.get(('name', 'etag', 0)))
+
+
+class StreamUrlTests(MediaTestCase):
+    def test_refresh_requires_access(self):
+        response = self.client.get(f'/video/{self.video.id}/stream-url/')
+        self.assertEqual(response.status_code, 200)
+        url = response.json()['url']
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.filter(user=self.student, course=self.course).delete()
+        self.assertEqual(self.client.get(f'/video/{self.video.id}/stream-url/').status_code, 404)
+
+    def test_urls_expire(self):
+        url = self.client.get(f'/video/{self.video.id}/stream-url/').json()['url']
+        with mock.patch('time.time', return_value=time.time() + settings.VIDEO_STREAM_URL_MAX_AGE + 1):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class DashboardQueryTests(MediaTestCase):
+    def dashboard_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_courses(self):
+        baseline = self.dashboard_queries()
+        for number in range(2, 12):
+            course = self.create_course(f'Course {number}')
+            self.create_video(course, 1)
+            if number % 2:
+                Enrollment.objects.create(user=self.student, course=course)
+        cache.clear()
+        with self.assertNumQueries(baseline):
+            self.client.get('/dashboard/')
+
+
+@override_settings(DASHBOARD_PAGE_SIZE=5)
+class SearchPaginationTests(MediaTestCase):
+    def test_cursor_survives_course_leaving_the_ranking(self):
+        for number in range(12):
+            self.create_course(f'Python {number}')
+        response = self.client.get('/dashboard/', {'search': 'python'})
+        first_page = [course.id for course in response.context['available_courses']]
+        next_url = response.context['available_next_url']
+        self.assertEqual(len(first_page), 5)
+
+        # The course the cursor points at no longer matches the search
+        Course.objects.filter(id=first_page[-1]).update(title='Renamed', description='Renamed')
+        Course.objects.get(id=first_page[-1]).save()
+
+        rest = []
+        while next_url:
+            data = self.client.get(next_url).json()
+            rest += [int(course_id) for course_id in re.findall(r'/enroll/(\d+)/', data['html'])]
+            next_url = data['next_url']
+        self.assertEqual(len(rest), 7)
+        self.assertFalse(set(rest) & set(first_page))
+
+
+@unittest.skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'No full-text index on this database')
+class CourseSearchTests(MediaTestCase):
+    def search(self, query):
+        return search_course_ids(query, 10)
+
+    def test_title_matches_rank_above_description_matches(self):
+        in_description = self.create_course('Web development')
+        in_description.description = 'Building sites with Django'
+        in_description.save()
+        in_title = self.create_course('Django basics')
+        self.assertEqual(self.search('django'), [in_title.id, in_description.id])
+
+    def test_every_word_matches_as_a_prefix(self):
+        course = self.create_course('Introduction to Python')
+        self.assertEqual(self.search('pyth intro'), [course.id])
+        self.assertEqual(self.search('pyth rust'), [])
+
+    def test_instructor_name_matches(self):
+        self.assertEqual(self.search('instruct'), [self.course.id])
+
+    def test_index_follows_course_and_instructor_edits(self):
+        self.course.title = 'Advanced Rust'
+        self.course.description = 'Ownership and borrowing'
+        self.course.save()
+        self.assertEqual(self.search('rust'), [self.course.id])
+        self.assertEqual(self.search('course'), [])
+
+        self.instructor.username = 'ferris'
+        self.instructor.save()
+        self.assertEqual(self.search('ferris'), [self.course.id])
+        self.assertEqual(self.search('instructor'), [])
+
+        self.course.delete()
+        self.assertEqual(self.search('rust'), [])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'Only SQLite keeps a separate search table')
+    def test_rebuild_command_repopulates_the_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+        self.assertEqual(self.search('course'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 courses', out.getvalue())
+        self.assertEqual(self.search('course'), [self.course.id])
+
+
+class AutocompleteTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        # A second index stands in for another worker process
+        self.other = PrefixIndex(result_cache_size=16)
+        self.assertEqual(self.other.suggest('cours', 5), [('Course 1', 'course')])
+
+    def add_course(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_course(title)
+
+    def test_other_process_applies_changes_without_rebuilding(self):
+        with mock.patch.object(self.other, '_build', side_effect=AssertionError('rebuilt')):
+            course = self.add_course('Coursework')
+            self.assertEqual(self.other.suggest('cours', 5), [('Course 1', 'course'), ('Coursework', 'course')])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.instructor.username = 'teacher'
+                self.instructor.save()
+            self.assertEqual(self.other.suggest('teach', 5), [('teacher', 'instructor')])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                course.delete()
+            self.assertEqual(self.other.suggest('cours', 5), [('Course 1', 'course')])
+
+    def test_changes_are_published_on_commit(self):
+        version = cache.get(VERSION_CACHE_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_course('Coursework')
+            self.assertEqual(cache.get(VERSION_CACHE_KEY), version)
+            self.assertEqual(self.other.suggest('cours', 5), [('Course 1', 'course')])
+        self.assertEqual(cache.get(VERSION_CACHE_KEY), version + 1)
+
+    def test_missing_change_record_rebuilds(self):
+        self.add_course('Coursework')
+        cache.delete(CHANGE_CACHE_KEY.format(cache.get(VERSION_CACHE_KEY)))
+        self.add_course('Courses')
+        with mock.patch.object(self.other, '_build', wraps=self.other._build) as build:
+            self.assertEqual(len(self.other.suggest('cours', 5)), 3)
+        build.assert_called_once()
+
+    def test_evicted_version_is_not_reused(self):
+        cache.delete(VERSION_CACHE_KEY)
+        self.add_course('Coursework')
+        self.assertIn(('Coursework', 'course'), self.other.suggest('cours', 5))
+
+
+class WatchVideoTests(MediaTestCase):
+    def watch(self, order=1):
+        response = self.client.get(f'/watch/{self.course.id}/{order}/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_is_constant(self):
+        for order in range(2, 30):
+            self.create_video(self.course, order)
+        self.watch()  # warm the playlist and access caches
+        with CaptureQueriesContext(connection) as queries:
+            self.watch(15)
+        baseline = len(queries)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for order in range(30, 80):
+                self.create_video(self.course, order)
+        self.watch()
+        with self.assertNumQueries(baseline):
+            response = self.watch(60)
+        self.assertEqual(response.context['video_position'], 60)
+        self.assertEqual(response.context['previous_video'].order, 59)
+        self.assertEqual(response.context['next_video'].order, 61)
+
+    def test_missing_description_has_empty_summary(self):
+        Video.objects.filter(pk=self.video.pk).update(description=None)
+        entry = self.watch().context['videos_in_course'][0]
+        self.assertEqual(entry.summary, '')
+
+
+class PlaylistCacheTests(MediaTestCase):
+    def test_evicted_version_is_not_reused(self):
+        self.assertEqual(len(get_playlist(self.course.id)), 1)
+        cache.delete(f'playlist:version:{self.course.id}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_video(self.course, 2)
+        self.assertEqual([entry.order for entry in get_playlist(self.course.id)], [1, 2])
+
+
+class VideoOrderTests(MediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.videos = [cls.video] + [cls.create_video(cls.course, order) for order in range(2, 5)]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.instructor)
+
+    def orders(self):
+        return list(Video.objects.filter(course=self.course).order_by('order').values_list('id', 'order'))
+
+    def reorder(self, ids):
+        """
+        Post a new order and return the last message it left
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/course/{self.course.id}/reorder/', {'order': json.dumps(ids)})
+        return [str(message) for message in get_messages(response.wsgi_request)][-1]
+
+    def test_permutation_is_applied(self):
+        ids = [video.id for video in self.videos]
+        permutation = [ids[2], ids[0], ids[3], ids[1]]
+        get_playlist(self.course.id)
+        self.assertEqual(self.reorder(permutation), 'Videos reordered successfully!')
+        self.assertEqual(self.orders(), [(video_id, order) for order, video_id in enumerate(permutation, start=1)])
+        self.assertEqual([entry.id for entry in get_playlist(self.course.id)], permutation)
+
+    def test_partial_duplicate_or_foreign_lists_are_rejected(self):
+        ids = [video.id for video in self.videos]
+        foreign = self.create_video(self.create_course('Course 2'), 1)
+        before = self.orders()
+        for posted in (ids[:3], ids[:3] + [ids[0]], ids + [ids[0]], ids[:3] + [foreign.id], ids + [foreign.id]):
+            self.assertEqual(self.reorder(posted), 'The video list has changed. Please try reordering again.', posted)
+            self.assertEqual(self.orders(), before, posted)
+        self.assertEqual(Video.objects.get(pk=foreign.pk).order, 1)
+
+    def test_bulk_delete_closes_gaps_and_adjusts_counters(self):
+        ids = [video.id for video in self.videos]
+        for number, video_id in enumerate(ids, start=1):
+            Video.objects.filter(pk=video_id).update(duration=number * 10)
+        Course.objects.filter(pk=self.course.pk).update(total_duration=100)
+        foreign = self.create_video(self.create_course('Course 2'), 1)
+        get_playlist(self.course.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/course/{self.course.id}/delete-videos/', {'video_ids': [ids[0], ids[2], foreign.id]})
+        self.assertEqual(self.orders(), [(ids[1], 1), (ids[3], 2)])
+        self.assertEqual([entry.id for entry in get_playlist(self.course.id)], [ids[1], ids[3]])
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual((course.video_count, course.total_duration), (2, 60))
+        self.assertTrue(Video.objects.filter(pk=foreign.pk).exists())
+
+    def test_student_cannot_reorder(self):
+        self.client.force_login(self.student)
+        before = self.orders()
+        self.reorder([video.id for video in reversed(self.videos)])
+        self.assertEqual(self.orders(), before)
+
+
+class CourseAccessTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_course = self.create_course('Course 2')
+        self.other_video = self.create_video(self.other_course, 1)
+
+    def can_watch(self):
+        response = self.client.get(f'/watch/{self.other_course.id}/1/')
+        return response.status_code == 200
+
+    def test_enroll_and_unenroll_take_effect(self):
+        self.assertFalse(self.can_watch())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/enroll/{self.other_course.id}/')
+        self.assertTrue(self.can_watch())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/unenroll/{self.other_course.id}/')
+        self.assertFalse(self.can_watch())
+
+    def test_cached_access_needs_no_queries(self):
+        request = RequestFactory().get('/')
+        request.user = self.student
+        access.course_access(request)
+
+        request = RequestFactory().get('/')
+        request.user = self.student
+        with self.assertNumQueries(0):
+            self.assertTrue(access.course_access(request).can_view(self.course.id))
+
+    def test_load_racing_an_enrollment_is_not_kept(self):
+        load_access = access._load_access
+
+        def load_before_enrollment(user_id):
+            # Another request enrolls between this load and its cache write
+            loaded = load_access(user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                Enrollment.objects.create(user=self.student, course=self.other_course)
+            return loaded
+
+        with mock.patch.object(access, '_load_access', load_before_enrollment):
+            self.assertFalse(self.can_watch())
+        self.assertTrue(self.can_watch())
+
+
+class JobLeaseTests(MediaTestCase):
+    def test_renewed_lease_is_not_reclaimed(self):
+        Job.objects.all().delete()
+        job = Job.objects.create(kind='process_video', video=self.video)
+        self.assertEqual(claim_jobs(1), [job])
+
+        with override_settings(JOB_LEASE=-1):
+            renew_leases([job.id])
+        self.assertEqual(claim_jobs(1), [job])  # the lease ran out
+
+        renew_leases([job.id])
+        self.assertEqual(claim_jobs(1), [])
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+
+    def test_job_that_keeps_killing_its_worker_fails(self):
+        Job.objects.all().delete()
+        job = Job.objects.create(kind='process_video', video=self.video, max_attempts=2)
+        for attempt in range(2):
+            self.assertEqual(claim_jobs(1), [job])
+            # The worker dies without recording anything; the lease runs out
+            Job.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(claim_jobs(1), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.processing_status, Video.PROCESSING_FAILED)
+
+
+class BlobReferenceTests(MediaTestCase):
+    def ref_count(self, name):
+        return MediaBlob.objects.get(sha256=blob_digest(name)).ref_count
+
+    def test_saved_content_holds_a_reference(self):
+        storage = get_video_storage()
+        name = storage.save('copy.mp4', ContentFile(self.video_data))
+        self.assertEqual(name, self.video.video_file.name)
+
+        # The only video using the blob goes before the copy is saved anywhere
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(self.ref_count(name), 1)
+
+    def test_each_video_counts_once(self):
+        self.assertEqual(self.ref_count(self.video.video_file.name), 1)
+        self.create_video(self.course, 2, self.video_data)
+        self.assertEqual(self.ref_count(self.video.video_file.name), 2)
+
+        self.video.video_file.save('again.mp4', ContentFile(self.video_data))
+        self.assertEqual(self.ref_count(self.video.video_file.name), 2)
+
+    def test_failed_save_gives_the_reference_back(self):
+        video = Video(title='Broken', course=self.course, order=None)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            video.video_file.save('broken.mp4', ContentFile(b'never stored'))
+        self.assertFalse(MediaBlob.objects.filter(ref_count__gt=0, size=len(b'never stored')).exists())
+        self.assertNotIn('_blob_reference', video.__dict__)
+
+
+class ResumableUploadTests(MediaTestCase):
+    data = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.instructor)
+        response = self.client.post(f'/course/{self.course.id}/uploads/', {
+            'title': 'Uploaded', 'filename': 'uploaded.mp4', 'size': len(self.data),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.url = response['Location']
+        self.upload = VideoUpload.objects.get()
+
+    def patch(self, offset, data, **headers):
+        return self.client.generic(
+            'PATCH', self.url, data, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **headers,
+        )
+
+    def stored(self):
+        with default_storage.open(self.upload.file_name) as file:
+            return file.read()
+
+    def test_chunks_create_the_video(self):
+        self.assertEqual(self.patch(0, self.data[:600]).status_code, 204)
+        checksum = 'sha256 ' + base64.b64encode(hashlib.sha256(self.data[600:]).digest()).decode()
+        response = self.patch(600, self.data[600:], HTTP_UPLOAD_CHECKSUM=checksum)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], str(len(self.data)))
+        video = Video.objects.get(title='Uploaded')
+        self.assertEqual((video.order, video.video_file.name), (2, self.upload.file_name))
+        self.assertEqual(self.stored(), self.data)
+
+    def test_offset_mismatch_is_a_conflict(self):
+        self.patch(0, self.data[:100])
+        for offset in (0, 200):
+            response = self.patch(offset, self.data[offset:offset + 100])
+            self.assertEqual(response.status_code, 409, offset)
+            self.assertEqual(response['Upload-Offset'], '100')
+        self.assertEqual(self.stored(), self.data[:100])
+
+    def test_chunk_held_by_another_request_is_a_conflict(self):
+        VideoUpload.objects.filter(pk=self.upload.pk).update(busy_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.patch(0, self.data[:100]).status_code, 409)
+        self.assertEqual(self.stored(), b'')
+
+        # A lease left behind by a request that died is taken over once it expires
+        VideoUpload.objects.filter(pk=self.upload.pk).update(busy_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.patch(0, self.data[:100]).status_code, 204)
+        self.upload.refresh_from_db()
+        self.assertEqual((self.upload.offset, self.upload.busy_until), (100, None))
+
+    def test_chunk_past_announced_length_is_too_large(self):
+        self.patch(0, self.data[:1000])
+        response = self.patch(1000, self.data[1000:] + b'extra')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response['Upload-Offset'], '1000')
+        self.assertFalse(Video.objects.filter(title='Uploaded').exists())
+
+    def test_checksum_mismatch_keeps_nothing(self):
+        checksum = 'md5 ' + base64.b64encode(hashlib.md5(b'other').digest()).decode()
+        response = self.patch(0, self.data[:100], HTTP_UPLOAD_CHECKSUM=checksum)
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(response['Upload-Offset'], '0')
+        self.assertEqual(self.stored(), b'')
+
+    def test_dropped_connection_keeps_partial_bytes(self):
+        # The client announced 500 bytes, but the connection dropped after 300
+        self.assertEqual(append_chunk(self.upload, BytesIO(self.data[:300]), 0, 500), 300)
+        self.upload.refresh_from_db()
+        self.assertEqual((self.upload.offset, self.upload.busy_until), (300, None))
+        self.assertEqual(self.stored(), self.data[:300])
+
+        # With a checksum the chunk is all or nothing
+        digest = hashlib.sha256(self.data[300:800]).digest()
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(self.upload, BytesIO(self.data[300:500]), 300, 500, ('sha256', digest))
+        self.assertEqual(raised.exception.status, 400)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, 300)
+        self.assertEqual(self.stored(), self.data[:300])
+
+    def test_discard_deletes_the_partial_file(self):
+        self.patch(0, self.data[:100])
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(VideoUpload.objects.filter(pk=self.upload.pk).exists())
+        self.assertFalse(default_storage.exists(self.upload.file_name))
+
+    def test_completed_upload_cannot_be_discarded(self):
+        self.patch(0, self.data)
+        self.assertEqual(self.client.delete(self.url).status_code, 409)
+        self.assertTrue(default_storage.exists(self.upload.file_name))
+
+
+class CleanMediaTests(MediaTestCase):
+    def start_upload(self, age_hours):
+        upload = create_upload(self.course, self.instructor, 'Upload', '', 'upload.mp4', 100)
+        started = time.time() - age_hours * 3600
+        VideoUpload.objects.filter(pk=upload.pk).update(created_at=timezone.now() - timedelta(hours=age_hours))
+        os.utime(default_storage.path(upload.file_name), (started, started))
+        return upload
+
+    def test_abandoned_uploads_are_deleted(self):
+        abandoned = self.start_upload(48)
+        recent = self.start_upload(1)
+
+        call_command('clean_media', '--dry-run', stdout=StringIO())
+        self.assertTrue(VideoUpload.objects.filter(pk=abandoned.pk).exists())
+
+        out = StringIO()
+        call_command('clean_media', stdout=out)
+        self.assertIn('1 abandoned uploads', out.getvalue())
+        self.assertFalse(VideoUpload.objects.filter(pk=abandoned.pk).exists())
+        self.assertFalse(default_storage.exists(abandoned.file_name))
+        self.assertTrue(VideoUpload.objects.filter(pk=recent.pk).exists())
+        self.assertTrue(default_storage.exists(recent.file_name))
+        self.assertTrue(default_storage.exists(self.video.video_file.name))
+
+    def test_upload_written_to_recently_is_kept(self):
+        upload = self.start_upload(48)
+        os.utime(default_storage.path(upload.file_name), None)
+        call_command('clean_media', stdout=StringIO())
+        self.assertTrue(VideoUpload.objects.filter(pk=upload.pk).exists())
+
+
+class ShardMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        # A video and thumbnail stored before sharding and content addressing
+        for name, data in (('course_videos/flat.mp4', b'flat video'), ('thumbnails/flat.png', b'png')):
+            with open(default_storage.path(name), 'wb') as file:
+                file.write(data)
+        Video.objects.filter(pk=self.video.pk).update(video_file='course_videos/flat.mp4')
+        Course.objects.filter(pk=self.course.pk).update(thumbnail='thumbnails/flat.png')
+
+    def test_flat_files_are_moved(self):
+        call_command('shard_media', stdout=StringIO())
+        self.video.refresh_from_db()
+        self.course.refresh_from_db()
+        self.assertTrue(blob_digest(self.video.video_file.name))
+        self.assertEqual(self.video.video_file.read(), b'flat video')
+        self.assertEqual(MediaBlob.objects.get(name=self.video.video_file.name).ref_count, 1)
+        self.assertTrue(self.course.thumbnail.field.upload_to.is_sharded(self.course.thumbnail.name))
+        self.assertFalse(default_storage.exists('course_videos/flat.mp4'))
+        self.assertFalse(default_storage.exists('thumbnails/flat.png'))
+
+    def test_video_replaced_while_ingesting_is_left_alone(self):
+        ingest = ContentAddressedStorage.ingest
+
+        def ingest_then_replace(storage, path, source_digest=None):
+            name = ingest(storage, path, source_digest)
+            Video.objects.filter(pk=self.video.pk).update(video_file='course_videos/replaced.mp4')
+            return name
+
+        with (
+            mock.patch.object(ContentAddressedStorage, 'ingest', ingest_then_replace),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            call_command('shard_media', stdout=StringIO())
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.video_file.name, 'course_videos/replaced.mp4')
+        self.assertTrue(default_storage.exists('course_videos/flat.mp4'))
+        self.assertFalse(MediaBlob.objects.filter(size=len(b'flat video')).exists())
+
+    def test_batch_is_renamed_in_one_update(self):
+        for order in range(2, 5):
+            video = self.create_video(self.course, order)
+            name = f'course_videos/flat{order}.mp4'
+            with open(default_storage.path(name), 'wb') as file:
+                file.write(b'flat %d' % order)
+            Video.objects.filter(pk=video.pk).update(video_file=name)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('shard_media', stdout=StringIO())
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "LibraryApp_video"')]
+        self.assertEqual(len(updates), 1)
+        names = Video.objects.values_list('video_file', flat=True)
+        self.assertEqual(len(names), 4)
+        self.assertTrue(all(blob_digest(name) for name in names))
+
+
+class FaststartTests(SimpleTestCase):
+    samples = [bytes([number]) * (100 + number) for number in range(1, 10)]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'video.mp4')
+
+    def write(self, data):
+        with open(self.path, 'wb') as file:
+            file.write(data)
+
+    def read_samples(self, path):
+        """
+        The chunk offset table type and the bytes of every sample, read
+        through the file's own sample tables
+        """
+        with open(path, 'rb') as file:
+            trak = find_box(read_moov(file, top_level_boxes(file)), b'trak')
+            stbl = find_box(trak, b'mdia', b'minf', b'stbl')
+            table = find_box(stbl, b'stco') or find_box(stbl, b'co64')
+            data = []
+            for sample in track_samples(trak):
+                file.seek(sample.offset)
+                data.append(file.read(sample.size))
+        return table.type, data
+
+    def box_types(self, path):
+        with open(path, 'rb') as file:
+            return [box[0] for box in top_level_boxes(file)]
+
+    def test_moov_is_moved_before_mdat(self):
+        self.write(build_mp4(self.samples))
+        self.assertEqual(self.read_samples(self.path), (b'stco', self.samples))
+        self.assertFalse(is_faststart(self.path))
+
+        self.assertTrue(make_faststart(self.path))
+        self.assertEqual(self.box_types(self.path), [b'ftyp', b'moov', b'mdat'])
+        self.assertEqual(self.read_samples(self.path), (b'stco', self.samples))
+        self.assertFalse(make_faststart(self.path))
+
+    def test_output_leaves_source_untouched(self):
+        data = build_mp4(self.samples, co64=True)
+        self.write(data)
+        output = os.path.join(self.directory, 'faststart.mp4')
+        self.assertTrue(make_faststart(self.path, output))
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), data)
+        self.assertTrue(is_faststart(output))
+        self.assertEqual(self.read_samples(output), (b'co64', self.samples))
+
+    def test_offsets_past_32_bits_switch_to_co64(self):
+        self.write(build_mp4(self.samples))
+        with open(self.path, 'rb') as file:
+            moov_offset = top_level_boxes(file)[-1][1]
+        # Moving moov forward pushes the last chunk past where moov started
+        with mock.patch('LibraryApp.mp4.STCO_MAX_OFFSET', moov_offset):
+            self.assertTrue(make_faststart(self.path))
+        self.assertEqual(self.box_types(self.path), [b'ftyp', b'moov', b'mdat'])
+        self.assertEqual(self.read_samples(self.path), (b'co64', self.samples))
+
+
+class SeekIndexTests(MediaTestCase):
+    samples = [bytes([number]) * (100 + number) for number in range(1, 10)]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Keyframes at samples 1, 5 and 9: 0, 2 and 4 seconds
+        cls.mp4_video = cls.create_video(cls.course, 2, build_mp4(cls.samples, keyframes=[1, 5, 9]))
+        # Sample data starts after ftyp (24 bytes) and the mdat header
+        cls.sample_offsets = [32 + sum(map(len, cls.samples[:number])) for number in range(len(cls.samples))]
+
+    def test_keyframes_are_extracted(self):
+        metadata = extract_metadata(self.mp4_video.video_file.path)
+        self.assertEqual(metadata['duration'], 4.5)
+        self.assertEqual(metadata['bitrate'], int(self.mp4_video.video_file.size * 8 / 4.5))
+        self.assertEqual(
+            metadata['keyframes'],
+            [(0.0, self.sample_offsets[0]), (2.0, self.sample_offsets[4]), (4.0, self.sample_offsets[8])],
+        )
+
+    def test_all_sync_samples_are_thinned_to_one_per_second(self):
+        path = os.path.join(self.media_root, 'all_sync.mp4')
+        with open(path, 'wb') as file:
+            file.write(build_mp4(self.samples))
+        keyframes = extract_metadata(path)['keyframes']
+        self.assertEqual(keyframes, [(seconds, self.sample_offsets[seconds * 2]) for seconds in range(5)])
+
+    def test_pack_round_trip(self):
+        keyframes = [(0.0, 32), (2.5, 70000), (4.0, 2 ** 40)]
+        self.assertEqual(unpack_seek_index(pack_seek_index(keyframes)), ([0.0, 2.5, 4.0], [32, 70000, 2 ** 40]))
+        self.assertEqual(unpack_seek_index(pack_seek_index([])), ([], []))
+        self.assertEqual(unpack_seek_index(None), ([], []))
+
+    def seek(self, video, t):
+        return self.client.get(f'/video/{video.id}/seek/', {'t': t})
+
+    def test_seek_returns_keyframe_at_or_before(self):
+        apply_metadata(self.mp4_video)
+        for t, keyframe in (('0', 0), ('1.9', 0), ('2', 4), ('3.5', 4), ('99', 8), ('-1', 0)):
+            response = self.seek(self.mp4_video, t)
+            self.assertEqual(response.status_code, 200, t)
+            self.assertEqual(
+                response.json(),
+                {'time': keyframe / 2, 'offset': self.sample_offsets[keyframe], 'duration': 4.5},
+                t,
+            )
+        self.assertEqual(self.seek(self.mp4_video, 'soon').status_code, 400)
+
+    def test_seek_without_index_or_access(self):
+        self.assertEqual(self.seek(self.mp4_video, '1').status_code, 404)
+
+        apply_metadata(self.mp4_video)
+        self.client.force_login(User.objects.create_user('outsider', password='pw'))
+        self.assertEqual(self.seek(self.mp4_video, '1').status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.seek(self.mp4_video, '1').status_code, 302)
+
+
+@override_settings(VIDEO_DELIVERY_BACKEND='python', VIDEO_SEGMENT_DURATION=2)
+class HlsSegmentTests(MediaTestCase):
+    samples = SeekIndexTests.samples
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Keyframes at 0, 2 and 4 seconds; the track lasts 4.5 seconds
+        cls.mp4_video = cls.create_video(cls.course, 2, build_mp4(cls.samples, keyframes=[1, 5, 9]))
+
+    def setUp(self):
+        super().setUp()
+        self.assertEqual(apply_segmenting(self.mp4_video), 3)
+        self.mp4_video.refresh_from_db()
+
+    def get(self, name, video=None):
+        return self.client.get(f'/video/{(video or self.mp4_video).id}/hls/{name}')
+
+    def body(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_playlist_lists_segments_cut_at_keyframes(self):
+        lines = self.body(self.get('playlist.m3u8')).decode().splitlines()
+        self.assertIn('#EXT-X-TARGETDURATION:2', lines)
+        self.assertIn('#EXT-X-MAP:URI="init.mp4"', lines)
+        self.assertEqual(
+            [line for line in lines if not line.startswith('#')],
+            ['seg_00001.m4s', 'seg_00002.m4s', 'seg_00003.m4s'],
+        )
+        self.assertEqual(
+            [line for line in lines if line.startswith('#EXTINF')],
+            ['#EXTINF:2.000,', '#EXTINF:2.000,', '#EXTINF:0.500,'],
+        )
+        self.assertEqual(lines[-1], '#EXT-X-ENDLIST')
+
+    def test_init_and_media_segments(self):
+        init = self.body(self.get('init.mp4'))
+        self.assertEqual([box[0] for box in top_level_boxes(BytesIO(init))], [b'ftyp', b'moov'])
+        self.assertIsNotNone(find_box(read_moov(BytesIO(init), top_level_boxes(BytesIO(init))), b'mvex', b'trex'))
+
+        for number, samples in ((1, self.samples[0:4]), (2, self.samples[4:8]), (3, self.samples[8:])):
+            segment = BytesIO(self.body(self.get(f'seg_{number:05d}.m4s')))
+            boxes = top_level_boxes(segment)
+            self.assertEqual([box[0] for box in boxes], [b'moof', b'mdat'])
+            _, offset, header_size, size = boxes[1]
+            segment.seek(offset + header_size)
+            self.assertEqual(segment.read(size - header_size), b''.join(samples))
+
+    def test_missing_segments_and_bad_names(self):
+        self.assertEqual(self.get('seg_00004.m4s').status_code, 404)
+        self.assertEqual(self.get('seg_1.m4s').status_code, 404)
+        self.assertEqual(self.get('video.mp4').status_code, 404)
+        # Not segmented
+        self.assertEqual(self.get('playlist.m3u8', video=self.video).status_code, 404)
+
+    def test_unenrolled_user_is_denied(self):
+        self.assertEqual(self.get('init.mp4').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/unenroll/{self.course.id}/')
+        self.assertFalse(Enrollment.objects.filter(user=self.student, course=self.course).exists())
+        for name in ('playlist.m3u8', 'init.mp4', 'seg_00001.m4s'):
+            self.assertEqual(self.get(name).status_code, 404, name)
+
+
+@mock.patch('LibraryApp.processing.extract_metadata', return_value={'duration': 10.0, 'bitrate': 8000, 'keyframes': []})
+class CourseCounterTests(MediaTestCase):
+    def counters(self):
+        course = Course.objects.get(pk=self.course.pk)
+        return course.video_count, course.enrollment_count, course.total_duration
+
+    def test_signals_keep_counters(self, extract):
+        self.assertEqual(self.counters(), (1, 1, 0))
+        video = Video(title='Timed', course=self.course, order=2, duration=4.5)
+        video.video_file.save('timed.mp4', ContentFile(b'timed'))
+        Enrollment.objects.create(user=self.instructor, course=self.course)
+        self.assertEqual(self.counters(), (2, 2, 4.5))
+
+        video.delete()
+        Enrollment.objects.filter(user=self.student).delete()
+        self.assertEqual(self.counters(), (1, 1, 0))
+
+    def test_overlapping_metadata_jobs_count_once(self, extract):
+        first, second = Video.objects.get(pk=self.video.pk), Video.objects.get(pk=self.video.pk)
+        self.assertTrue(apply_metadata(first))
+        self.assertTrue(apply_metadata(second))
+        self.assertEqual(self.counters()[2], 10)
+
+    def test_metadata_for_deleted_video_is_dropped(self, extract):
+        stale = Video.objects.get(pk=self.video.pk)
+        self.video.delete()
+        self.assertFalse(apply_metadata(stale))
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+    def test_delete_subtracts_duration_stored_after_loading(self, extract):
+        stale = Video.objects.get(pk=self.video.pk)
+        apply_metadata(Video.objects.get(pk=self.video.pk))
+        stale.delete()
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+    def test_bulk_delete_adjusts_counters(self, extract):
+        apply_metadata(self.video)
+        second = self.create_video(self.course, 2)
+        apply_metadata(second)
+        self.create_video(self.course, 3)
+        self.client.force_login(self.instructor)
+        self.client.post(f'/course/{self.course.id}/delete-videos/', {'video_ids': [self.video.id, second.id]})
+        self.assertEqual(self.counters(), (1, 1, 0))
+
+    def test_rebuild_fixes_drift(self, extract):
+        Course.objects.filter(pk=self.course.pk).update(video_count=7, enrollment_count=0, total_duration=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_course_counters', '--check', stdout=StringIO())
+        self.assertEqual(self.counters(), (7, 0, 99))
+
+        call_command('rebuild_course_counters', stdout=StringIO())
+        self.assertEqual(self.counters(), (1, 1, 0))
+        call_command('rebuild_course_counters', '--check', stdout=StringIO())
@@ -0,0 +1,170 @@
+import base64
+import binascii
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import Course, Video, VideoUpload
+
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+# Status codes of the tus protocol that have no name in http.HTTPStatus
+CHECKSUM_MISMATCH = 460
+
+
+class UploadError(Exception):
+    """
+    A rejected upload request, with the HTTP status to answer with
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_checksum(header):
+    """
+    Parse an `Upload-Checksum: <algorithm> <base64 digest>` header into
+    (algorithm, digest bytes), or None if the header is absent
+    """
+    if not header:
+        return None
+    try:
+        algorithm, encoded = header.split(' ', 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except (ValueError, binascii.Error):
+        raise UploadError(400, 'Malformed Upload-Checksum header')
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise UploadError(400, f'Unsupported checksum algorithm "{algorithm}"')
+    return algorithm, digest
+
+
+def create_upload(course, user, title, description, filename, size):
+    """
+    Register a resumable upload and reserve its final storage name with an
+    empty file that later chunks are appended to
+    """
+    if size <= 0:
+        raise UploadError(400, 'Video is empty')
+    if size > settings.VIDEO_UPLOAD_MAX_SIZE:
+        raise UploadError(413, 'Video is too large')
+    name = get_valid_filename(os.path.basename(filename)) or 'video'
+    upload_to = Video._meta.get_field('video_file').upload_to
+    file_name = default_storage.save(upload_to(None, name), ContentFile(b''))
+    return VideoUpload.objects.create(
+        course=course,
+        user=user,
+        title=title,
+        description=description,
+        file_name=file_name,
+        size=size,
+    )
+
+
+def _acquire(upload, offset):
+    """
+    Take the write lease on `upload` if it is still at `offset` and no other
+    request holds it, so two PATCHes never write the same file at once
+    """
+    now = timezone.now()
+    claimed = VideoUpload.objects.filter(
+        Q(busy_until__isnull=True) | Q(busy_until__lt=now),
+        pk=upload.pk,
+        offset=offset,
+        video__isnull=True,
+    ).update(busy_until=now + timedelta(seconds=settings.VIDEO_UPLOAD_LEASE))
+    if not claimed:
+        raise UploadError(409, 'Upload offset changed or another chunk is being written')
+
+
+def append_chunk(upload, stream, offset, length, checksum=None):
+    """
+    Append `length` bytes read from `stream` to the upload's file at
+    `offset`, in constant memory. With a checksum the chunk is all or
+    nothing; without one, the bytes that arrived before a dropped
+    connection are kept so the client resumes after them.
+
+    Returns the new offset.
+    """
+    if offset != upload.offset:
+        raise UploadError(409, f'Upload-Offset must be {upload.offset}')
+    if offset + length > upload.size:
+        raise UploadError(413, 'Chunk extends past the announced upload length')
+    if length > settings.VIDEO_UPLOAD_MAX_CHUNK:
+        raise UploadError(413, 'Chunk is too large')
+
+    _acquire(upload, offset)
+    try:
+        digest = hashlib.new(checksum[0]) if checksum else None
+        received = 0
+        with open(default_storage.path(upload.file_name), 'r+b') as target:
+            # Drop anything a failed earlier request wrote past the offset
+            target.truncate(offset)
+            target.seek(offset)
+            while received < length:
+                block = stream.read(min(settings.VIDEO_UPLOAD_READ_SIZE, length - received))
+                if not block:
+                    break
+                target.write(block)
+                if digest is not None:
+                    digest.update(block)
+                received += len(block)
+
+            if checksum and (received < length or digest.digest() != checksum[1]):
+                target.truncate(offset)
+                if received < length:
+                    raise UploadError(400, 'Chunk ended early')
+                raise UploadError(CHECKSUM_MISMATCH, 'Checksum mismatch')
+
+        upload.offset = offset + received
+        VideoUpload.objects.filter(pk=upload.pk).update(offset=upload.offset, busy_until=None)
+    except BaseException:
+        VideoUpload.objects.filter(pk=upload.pk).update(busy_until=None)
+        raise
+
+    if upload.is_complete:
+        attach_video(upload)
+    return upload.offset
+
+
+def attach_video(upload):
+    """
+    Create the Video for a finished upload at the end of its course
+    """
+    with transaction.atomic():
+        Course.objects.select_for_update().only('id').get(id=upload.course_id)
+        locked = VideoUpload.objects.select_for_update().get(pk=upload.pk)
+        if locked.video_id:
+            upload.video_id = locked.video_id
+            return locked.video
+        max_order = Video.objects.filter(course_id=upload.course_id).aggregate(Max('order'))['order__max'] or 0
+        video = Video(
+            course_id=upload.course_id,
+            title=upload.title,
+            description=upload.description,
+            order=max_order + 1,
+        )
+        video.video_file.name = upload.file_name
+        video.save()
+        upload.video = video
+        upload.save(update_fields=['video'])
+    return video
+
+
+def discard_upload(upload):
+    """
+    Abandon an unfinished upload and delete its partial file
+    """
+    if upload.video_id:
+        raise UploadError(409, 'Upload is already complete')
+    upload.delete()
+    default_storage.delete(upload.file_name)
@@ -4,12 +4,20 @@ from . import views
 
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/courses/', views.course_list_page, name='course_list_page'),
+    path('dashboard/suggestions/', views.search_suggestions, name='search_suggestions'),
     path('watch/<int:course_id>/<int:video_order>/', views.watch_video, name='watch_video'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('', views.login_view), # Redirect root to login
     path('signup/', views.signup_view, name='signup'),
     path('video/stream/<int:video_id>/', views.serve_video, name='serve_video'),
+    path('video/stream/<int:video_id>/async/', views.serve_video_async, name='serve_video_async'),
+    path('video/<int:video_id>/seek/', views.video_seek, name='video_seek'),
+    path('video/<int:video_id>/hls/<str:name>', views.serve_segment, name='serve_segment'),
+    path('video/stream/signed/<str:token>/', views.serve_signed_video, name='serve_signed_video'),
+    path('video/<int:video_id>/stream-url/', views.video_stream_url, name='video_stream_url'),
+    path('course/<int:course_id>/thumbnail/', views.serve_thumbnail, name='serve_thumbnail'),
     
     # Add this line for course enrollment:
     path('enroll/<int:course_id>/', views.enroll_course, name='enroll_course'),
@@ -17,8 +25,11 @@ urlpatterns = [
     path('unenroll/<int:course_id>/', views.unenroll_course, name='unenroll_course'),
      path('video/<int:video_id>/edit/', views.edit_video, name='edit_video'),
     path('video/<int:video_id>/delete/', views.delete_video, name='delete_video'),
+    path('course/<int:course_id>/delete-videos/', views.delete_videos, name='delete_videos'),
     path('course/<int:course_id>/edit/', views.edit_course, name='edit_course'),
     path('course/<int:course_id>/add-videos/', views.add_videos_to_course, name='add_videos'),
     path('course/<int:course_id>/reorder/', views.reorder_videos, name='reorder_videos'),
+    path('course/<int:course_id>/uploads/', views.create_video_upload, name='create_video_upload'),
+    path('uploads/<uuid:upload_id>/', views.video_upload, name='video_upload'),
 
 ]
\ No newline at end of file
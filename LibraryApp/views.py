@@ -2,54 +2,183 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
-from networkx import reverse
-from .models import Course, Video, Enrollment
+from .models import Course, Video, Enrollment, VideoUpload
 from .forms import CustomSignUpForm  # ← Import your custom form
 
-from django.http import StreamingHttpResponse, Http404, FileResponse
-from wsgiref.util import FileWrapper
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.conf import settings
+from django.utils.cache import patch_cache_control
 import os
+import re
 import mimetypes
 
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.db import models
+from django.db.models import Q, Case, When, Value, F
+from django.db import models, transaction
 from .forms import CourseForm, VideoFormSet
+from .streaming import StoredFile, get_delivery_backend, python_delivery, run_in_read_executor
+from .stream_tokens import make_stream_url, read_stream_token, token_video_file
+from .search import search_course_ids
+from .autocomplete import get_prefix_index
+from .playlist import get_playlist, invalidate_playlist, locate
+from .access import acourse_access, course_access, invalidate_course_access
+from .uploads import (
+    CHECKSUM_MISMATCH, UploadError, append_chunk, create_upload, discard_upload, parse_checksum,
+)
+
+SEGMENT_FILE_RE = re.compile(r'^(playlist\.m3u8|init\.mp4|seg_\d{5}\.m4s)$')
+SEGMENT_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+}
+
+def _catalog_querysets(user, search_query):
+    """
+    Lazy enrolled/available course querysets for the dashboard, with the
+    instructor joined in (video counts are a stored column), plus the search
+    ranking ({course id: position}, None when not searching)
+    """
+    enrolled_ids = Enrollment.objects.filter(user=user).values('course_id')
+    courses = Course.objects.select_related('instructor')
+    ranking = None
+    
+    # Apply search filter if query exists
+    if search_query:
+        ranked_ids = search_course_ids(search_query, settings.COURSE_SEARCH_LIMIT)
+        if ranked_ids is None:
+            # No full-text index on this database
+            search_filter = Q(title__icontains=search_query) | Q(description__icontains=search_query) | Q(instructor__username__icontains=search_query)
+            courses = courses.filter(search_filter)
+        else:
+            ranking = {course_id: position for position, course_id in enumerate(ranked_ids)}
+            courses = courses.filter(id__in=ranked_ids)
+    
+    return {
+        'enrolled': courses.filter(id__in=enrolled_ids),
+        'available': courses.exclude(id__in=enrolled_ids),
+    }, ranking
+
+
+def _course_page(queryset, after, ranking=None):
+    """
+    Keyset pagination on id: the page after cursor `after` and the cursor
+    for the following page (None on the last page). There is no OFFSET, so
+    every page costs one index range scan.
+    
+    Search results are ordered by relevance instead, and the cursor is the
+    (rank, id) of the last course shown, so a page still continues from
+    the right place if that course has since dropped out of the ranking.
+    """
+    page_size = settings.DASHBOARD_PAGE_SIZE
+    if ranking is None:
+        if after:
+            queryset = queryset.filter(id__gt=after)
+        courses = list(queryset.order_by('id')[:page_size + 1])
+    else:
+        position = after or (-1, 0)
+        courses = sorted(
+            (course for course in queryset if (ranking[course.id], course.id) > position),
+            key=lambda course: ranking[course.id],
+        )
+    if len(courses) <= page_size:
+        return courses, None
+    last = courses[page_size - 1]
+    cursor = last.id if ranking is None else f'{ranking[last.id]}:{last.id}'
+    return courses[:page_size], cursor
+
+
+def _parse_cursor(value, ranking):
+    """
+    Parse an `after` cursor from _course_page: an id, or "rank:id" for
+    search results. Raises ValueError if it is malformed.
+    """
+    if not value:
+        return None
+    if ranking is None:
+        return int(value)
+    rank, course_id = value.split(':')
+    return int(rank), int(course_id)
+
+
+def _next_page_url(list_name, cursor, search_query):
+    if cursor is None:
+        return None
+    params = {'list': list_name, 'after': cursor}
+    if search_query:
+        params['search'] = search_query
+    return f"{reverse('course_list_page')}?{urlencode(params)}"
+
 
 @login_required
 def dashboard(request):
     """
     Dashboard view showing enrolled and available courses with search
     """
-    user = request.user
     search_query = request.GET.get('search', '').strip()
+    catalog, ranking = _catalog_querysets(request.user, search_query)
     
-    # Get enrolled course IDs
-    enrolled_course_ids = Enrollment.objects.filter(user=user).values_list('course_id', flat=True)
-    
-    # Base querysets
-    enrolled_courses = Course.objects.filter(id__in=enrolled_course_ids).annotate(
-        video_count=Count('videos')
-    )
-    available_courses = Course.objects.exclude(id__in=enrolled_course_ids).annotate(
-        video_count=Count('videos')
-    )
-    
-    # Apply search filter if query exists
-    if search_query:
-        search_filter = Q(title__icontains=search_query) | Q(description__icontains=search_query) | Q(instructor__username__icontains=search_query)
-        enrolled_courses = enrolled_courses.filter(search_filter)
-        available_courses = available_courses.filter(search_filter)
+    # First page of each list; later pages come from course_list_page
+    enrolled_courses, enrolled_next = _course_page(catalog['enrolled'], None, ranking)
+    available_courses, available_next = _course_page(catalog['available'], None, ranking)
     
     context = {
         'enrolled_courses': enrolled_courses,
         'available_courses': available_courses,
+        'enrolled_next_url': _next_page_url('enrolled', enrolled_next, search_query),
+        'available_next_url': _next_page_url('available', available_next, search_query),
         'search_query': search_query,
     }
     
     return render(request, 'LibraryApp/dashboard.html', context)
 
 
+@login_required
+def course_list_page(request):
+    """
+    Next page of enrolled or available course cards for infinite scroll,
+    as JSON with the rendered HTML and the URL of the following page
+    """
+    list_name = request.GET.get('list')
+    search_query = request.GET.get('search', '').strip()
+    
+    catalog, ranking = _catalog_querysets(request.user, search_query)
+    if list_name not in catalog:
+        return JsonResponse({'error': 'Unknown list'}, status=400)
+    
+    try:
+        after = _parse_cursor(request.GET.get('after'), ranking)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    courses, cursor = _course_page(catalog[list_name], after, ranking)
+    template_name = f'LibraryApp/partials/{list_name}_course_card.html'
+    html = ''.join(
+        render_to_string(template_name, {'course': course}, request=request)
+        for course in courses
+    )
+    
+    return JsonResponse({
+        'html': html,
+        'next_url': _next_page_url(list_name, cursor, search_query),
+    })
+
+
+@login_required
+def search_suggestions(request):
+    """
+    Course titles and instructor names matching the typed prefix, as JSON,
+    served from the in-memory prefix index without touching the catalog
+    """
+    prefix = request.GET.get('q', '').strip()
+    suggestions = get_prefix_index().suggest(prefix, settings.AUTOCOMPLETE_LIMIT)
+    return JsonResponse({
+        'suggestions': [{'label': label, 'type': kind} for label, kind in suggestions],
+    })
+
+
 @login_required
 def enroll_course(request, course_id):
     """
@@ -58,11 +187,12 @@ def enroll_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     
     # Check if already enrolled
-    if Enrollment.objects.filter(user=request.user, course=course).exists():
+    if course.id in course_access(request).enrolled:
         messages.warning(request, f'You are already enrolled in "{course.title}"')
     else:
         # Create enrollment
-        Enrollment.objects.create(user=request.user, course=course)
+        Enrollment.objects.get_or_create(user=request.user, course=course)
+        invalidate_course_access(request.user.id, request)
         messages.success(request, f'Successfully enrolled in "{course.title}"!')
     
     return redirect('dashboard')
@@ -73,28 +203,28 @@ def watch_video(request, course_id, video_order):
     """
     Displays a specific video from a course.
     """
-    course = get_object_or_404(Course, id=course_id)
+    course = get_object_or_404(Course.objects.select_related('instructor'), id=course_id)
     
     # Check if the user is enrolled in this course or is the instructor
-    is_instructor = course.instructor == request.user
-    is_enrolled = Enrollment.objects.filter(user=request.user, course=course).exists()
-    
-    if not (is_instructor or is_enrolled):
+    if not course_access(request).can_view(course.id):
         return redirect('dashboard')
 
-    video = get_object_or_404(Video, course=course, order=video_order)
-    videos_in_course = course.videos.all().order_by('order')
-    
-    # Get previous and next videos
-    previous_video = videos_in_course.filter(order__lt=video_order).order_by('-order').first()
-    next_video = videos_in_course.filter(order__gt=video_order).order_by('order').first()
+    # One ordered playlist drives the sidebar, prev/next and progress
+    playlist = get_playlist(course.id)
+    index = locate(playlist, video_order)
+    if index is None:
+        raise Http404("Video not found")
+    video = get_object_or_404(Video.objects.defer('seek_index'), id=playlist[index].id)
 
     context = {
         'video': video,
         'course': course,
-        'videos_in_course': videos_in_course,
-        'previous_video': previous_video,
-        'next_video': next_video,
+        'videos_in_course': playlist,
+        'video_count': len(playlist),
+        'video_position': index + 1,
+        'previous_video': playlist[index - 1] if index > 0 else None,
+        'next_video': playlist[index + 1] if index + 1 < len(playlist) else None,
+        'stream_url': make_stream_url(request, video),
     }
     return render(request, 'LibraryApp/watch_video.html', context)
 
@@ -106,7 +236,7 @@ def edit_video(request, video_id):
     video = get_object_or_404(Video, id=video_id)
     
     # Check if user is the course instructor
-    if video.course.instructor != request.user:
+    if not course_access(request).can_manage(video.course_id):
         messages.error(request, 'You do not have permission to edit this video.')
         return redirect('dashboard')
     
@@ -120,9 +250,9 @@ def edit_video(request, video_id):
         
         video.save()
         messages.success(request, f'Video "{video.title}" updated successfully!')
-        return redirect('watch_video', course_id=video.course.id, video_order=video.order)
+        return redirect('watch_video', course_id=video.course_id, video_order=video.order)
     
-    return redirect('watch_video', course_id=video.course.id, video_order=video.order)
+    return redirect('watch_video', course_id=video.course_id, video_order=video.order)
 
 @login_required
 def delete_video(request, video_id):
@@ -130,34 +260,79 @@ def delete_video(request, video_id):
     Delete a video (instructor only)
     """
     video = get_object_or_404(Video, id=video_id)
-    course = video.course
     
     # Check if user is the course instructor
-    if course.instructor != request.user:
+    if not course_access(request).can_manage(video.course_id):
         messages.error(request, 'You do not have permission to delete this video.')
         return redirect('dashboard')
+    course = video.course
     
     if request.method == 'POST':
         video_title = video.title
-        video.delete()
-        
-        # Reorder remaining videos
-        remaining_videos = Video.objects.filter(course=course).order_by('order')
-        for index, v in enumerate(remaining_videos, start=1):
-            v.order = index
-            v.save()
+        _delete_videos(course.id, [video.id])
         
         messages.success(request, f'Video "{video_title}" deleted successfully!')
         
         # Redirect to first video or dashboard
-        first_video = remaining_videos.first()
-        if first_video:
+        if Video.objects.filter(course=course).exists():
             return redirect('watch_video', course_id=course.id, video_order=1)
         else:
             return redirect('dashboard')
     
     return redirect('dashboard')
 
+@login_required
+def delete_videos(request, course_id):
+    """
+    Delete several selected videos of a course at once (instructor only)
+    """
+    course = get_object_or_404(Course, id=course_id)
+    
+    # Check if user is the course instructor
+    if not course_access(request).can_manage(course.id):
+        messages.error(request, 'You do not have permission to delete these videos.')
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        try:
+            video_ids = [int(video_id) for video_id in request.POST.getlist('video_ids')]
+        except ValueError:
+            video_ids = []
+        
+        deleted = _delete_videos(course.id, video_ids)
+        if deleted:
+            messages.success(request, f'{deleted} video(s) deleted from "{course.title}".')
+        else:
+            messages.warning(request, 'No videos were selected.')
+        
+        if Video.objects.filter(course=course).exists():
+            return redirect('watch_video', course_id=course.id, video_order=1)
+    
+    return redirect('dashboard')
+
+def _delete_videos(course_id, video_ids):
+    """
+    Delete the given videos of a course and close the gaps they leave in
+    the ordering with one set-based UPDATE, holding a row lock on the course.
+    Returns the number of videos deleted.
+    """
+    with transaction.atomic():
+        Course.objects.select_for_update().only('id').get(id=course_id)
+        videos = Video.objects.filter(course_id=course_id, id__in=video_ids)
+        deleted_orders = sorted(videos.values_list('order', flat=True))
+        if not deleted_orders:
+            return 0
+        videos.delete()
+        
+        # Each remaining video moves up by the number of deleted videos before it
+        shifts = [
+            When(order__gt=order, then=F('order') - count)
+            for count, order in reversed(list(enumerate(deleted_orders, start=1)))
+        ]
+        Video.objects.filter(course_id=course_id, order__gt=deleted_orders[0]).update(order=Case(*shifts))
+    invalidate_playlist(course_id)
+    return len(deleted_orders)
+
 @login_required
 def edit_course(request, course_id):
     """
@@ -166,7 +341,7 @@ def edit_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     
     # Check if user is the course instructor
-    if course.instructor != request.user:
+    if not course_access(request).can_manage(course.id):
         messages.error(request, 'You do not have permission to edit this course.')
         return redirect('dashboard')
     
@@ -195,16 +370,35 @@ def reorder_videos(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     
     # Check if user is the course instructor
-    if course.instructor != request.user:
+    if not course_access(request).can_manage(course.id):
         messages.error(request, 'You do not have permission to reorder videos.')
         return redirect('dashboard')
     
     if request.method == 'POST':
         import json
-        order = json.loads(request.POST.get('order', '[]'))
+        try:
+            order = [int(video_id) for video_id in json.loads(request.POST.get('order', '[]'))]
+        except (ValueError, TypeError):
+            messages.error(request, 'Invalid video order.')
+            return redirect('watch_video', course_id=course.id, video_order=1)
         
-        for index, video_id in enumerate(order, start=1):
-            Video.objects.filter(id=video_id, course=course).update(order=index)
+        with transaction.atomic():
+            # Lock the course so concurrent edits to its playlist wait for us
+            Course.objects.select_for_update().only('id').get(id=course.id)
+            course_videos = Video.objects.filter(course=course)
+            
+            # The posted order must be a permutation of the course's videos
+            if len(order) != len(set(order)) or set(order) != set(course_videos.values_list('id', flat=True)):
+                messages.error(request, 'The video list has changed. Please try reordering again.')
+                return redirect('watch_video', course_id=course.id, video_order=1)
+            
+            # Apply the whole permutation in one UPDATE ... CASE statement
+            if order:
+                course_videos.update(order=Case(
+                    *[When(id=video_id, then=Value(index)) for index, video_id in enumerate(order, start=1)],
+                    output_field=models.PositiveIntegerField(),
+                ))
+        invalidate_playlist(course.id)
         
         messages.success(request, 'Videos reordered successfully!')
         
@@ -270,147 +464,142 @@ def serve_video(request, video_id):
     video = get_object_or_404(Video, id=video_id)
     
     # Check if user is enrolled in the course or is the instructor
-    is_enrolled = Enrollment.objects.filter(
-        user=request.user, 
-        course=video.course
-    ).exists()
-    is_instructor = video.course.instructor == request.user
+    if not course_access(request).can_view(video.course_id):
+        raise Http404("Video not found or access denied")
+    
+    return _stream_video_file(request, video.video_file)
+
+
+@login_required
+def video_seek(request, video_id):
+    """
+    Return the keyframe at or before ?t=<seconds> and its byte offset as JSON,
+    from the seek index stored at upload
+    """
+    video = get_object_or_404(Video, id=video_id)
     
-    if not (is_enrolled or is_instructor):
+    # Check if user is enrolled in the course or is the instructor
+    if not course_access(request).can_view(video.course_id):
         raise Http404("Video not found or access denied")
     
-    # Get the video file path
-    video_path = video.video_file.path
+    try:
+        seconds = float(request.GET.get('t', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid time'}, status=400)
     
-    # Check if file exists
-    if not os.path.exists(video_path):
-        raise Http404("Video file not found")
+    keyframe = video.keyframe_at(seconds)
+    if keyframe is None:
+        raise Http404("No seek index for this video")
     
-    # Get file size
-    file_size = os.path.getsize(video_path)
+    return JsonResponse({
+        'time': keyframe[0],
+        'offset': keyframe[1],
+        'duration': video.duration,
+    })
+
+
+@login_required
+def serve_segment(request, video_id, name):
+    """
+    Serve the HLS playlist, init segment or a media segment of a video
+    """
+    video = get_object_or_404(Video, id=video_id)
     
-    # Determine content type
-    content_type, _ = mimetypes.guess_type(video_path)
-    content_type = content_type or 'video/mp4'
+    # Check if user is enrolled in the course or is the instructor
+    if not course_access(request).can_view(video.course_id):
+        raise Http404("Video not found or access denied")
     
-    # Handle range requests for video streaming
-    range_header = request.META.get('HTTP_RANGE', '').strip()
-    range_match = None
+    if not video.segment_count or not SEGMENT_FILE_RE.match(name):
+        raise Http404("Segment not found")
     
-    if range_header:
-        import re
-        range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
+    return _stream_video_file(request, StoredFile(f'{video.segments_dir}/{name}'))
+
+
+@login_required
+async def serve_video_async(request, video_id):
+    """
+    Async variant of serve_video for ASGI deployments. The permission check
+    uses the async ORM and the body is streamed from the event loop, so a
+    viewer does not hold a worker thread for the whole transfer. The file
+    checks (exists, stat, validators) run in the bounded read executor.
+    """
+    try:
+        video = await Video.objects.aget(id=video_id)
+    except Video.DoesNotExist:
+        raise Http404("Video not found or access denied")
     
-    if range_match:
-        # Partial content request (for video seeking)
-        start = int(range_match.group(1))
-        end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-        
-        # Ensure end doesn't exceed file size
-        end = min(end, file_size - 1)
-        
-        # Open file and seek to start position
-        video_file = open(video_path, 'rb')
-        video_file.seek(start)
-        
-        # Read only the requested chunk
-        chunk_size = end - start + 1
-        
-        def file_iterator(file_object, chunk_size_limit):
-            remaining = chunk_size_limit
-            while remaining > 0:
-                chunk = file_object.read(min(8192, remaining))
-                if not chunk:
-                    break
-                remaining -= len(chunk)
-                yield chunk
-            file_object.close()
-        
-        # Create streaming response with partial content
-        response = StreamingHttpResponse(
-            file_iterator(video_file, chunk_size),
-            status=206,
-            content_type=content_type
-        )
-        
-        response['Content-Length'] = str(chunk_size)
-        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
-        response['Accept-Ranges'] = 'bytes'
-        
-    else:
-        # Full content request
-        response = FileResponse(
-            open(video_path, 'rb'),
-            content_type=content_type
-        )
-        response['Content-Length'] = str(file_size)
-        response['Accept-Ranges'] = 'bytes'
+    # Check if user is enrolled in the course or is the instructor
+    access = await acourse_access(request)
+    if not access.can_view(video.course_id):
+        raise Http404("Video not found or access denied")
     
-    return response
+    return await run_in_read_executor(_stream_video_file, request, video.video_file)
+
+
+@login_required
+def video_stream_url(request, video_id):
     """
-    Serve video files from the database with streaming support
+    Return a fresh signed stream URL as JSON, for a player whose URL expired
     """
-    # Get the video object from database
-    video = get_object_or_404(Video, id=video_id)
+    video = get_object_or_404(Video.objects.only('id', 'course_id', 'video_file'), id=video_id)
+    
+    # Check if user is enrolled in the course or is the instructor
+    if not course_access(request).can_view(video.course_id):
+        raise Http404("Video not found or access denied")
     
-    # Optional: Add permission check to ensure user has access to this course
-    # if not video.course.enrolled_users.filter(id=request.user.id).exists():
-    #     raise Http404("Video not found")
+    return JsonResponse({'url': make_stream_url(request, video)})
+
+
+def serve_signed_video(request, token):
+    """
+    Serve a video from the signed, expiring URL minted by watch_video.
+    Access was checked when the URL was issued, so each range request only
+    verifies the signature, expiry and session cookie, without any queries.
+    """
+    payload = read_stream_token(request, token)
+    if payload is None:
+        raise Http404("Video not found or access denied")
     
+    return _stream_video_file(request, token_video_file(payload))
+
+
+def _stream_video_file(request, video_file):
+    """
+    Deliver an authorized video file through the configured backend
+    """
     # Get the video file path
-    video_path = video.video_file.path  # Assumes you have a FileField named 'video_file'
+    video_path = video_file.path
     
     # Check if file exists
     if not os.path.exists(video_path):
         raise Http404("Video file not found")
     
-    # Get file size
-    file_size = os.path.getsize(video_path)
-    
     # Determine content type
     content_type, _ = mimetypes.guess_type(video_path)
-    content_type = content_type or 'video/mp4'
-    
-    # Handle range requests for video streaming
-    range_header = request.META.get('HTTP_RANGE', '').strip()
-    range_match = None
-    
-    if range_header:
-        import re
-        range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
+    content_type = SEGMENT_CONTENT_TYPES.get(os.path.splitext(video_path)[1], content_type or 'video/mp4')
     
-    if range_match:
-        # Partial content request
-        start = int(range_match.group(1))
-        end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-        
-        # Open file and seek to start position
-        video_file = open(video_path, 'rb')
-        video_file.seek(start)
-        
-        # Create streaming response
-        response = StreamingHttpResponse(
-            FileWrapper(video_file, 8192),
-            status=206,
-            content_type=content_type
-        )
-        
-        response['Content-Length'] = str(end - start + 1)
-        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
-        response['Accept-Ranges'] = 'bytes'
-        
-    else:
-        # Full content request
-        response = FileResponse(
-            open(video_path, 'rb'),
-            content_type=content_type
-        )
-        response['Content-Length'] = str(file_size)
-        response['Accept-Ranges'] = 'bytes'
+    # Hand off to the configured delivery backend (in-process, nginx or X-Sendfile)
+    deliver = get_delivery_backend()
+    response = deliver(request, video_file, content_type)
+    if response.status_code in (200, 206, 304):
+        patch_cache_control(response, private=True, max_age=settings.VIDEO_CACHE_MAX_AGE)
+    return response
+
+
+@login_required
+def serve_thumbnail(request, course_id):
+    """
+    Serve a course thumbnail with ETag/Last-Modified validation and caching
+    """
+    course = get_object_or_404(Course, id=course_id)
     
-    # Optional: Prevent caching for sensitive content
-    # response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    if not course.thumbnail or not os.path.exists(course.thumbnail.path):
+        raise Http404("Thumbnail not found")
     
+    content_type, _ = mimetypes.guess_type(course.thumbnail.path)
+    response = python_delivery(request, course.thumbnail, content_type or 'application/octet-stream')
+    if response.status_code in (200, 304):
+        patch_cache_control(response, private=True, max_age=settings.THUMBNAIL_CACHE_MAX_AGE)
     return response
 
 @login_required(login_url='login')
@@ -504,6 +693,7 @@ def unenroll_course(request, course_id):
     
     if enrollment:
         enrollment.delete()
+        invalidate_course_access(request.user.id, request)
         messages.success(request, f'Successfully unenrolled from "{course.title}"')
     else:
         messages.warning(request, f'You are not enrolled in "{course.title}"')
@@ -519,9 +709,9 @@ def add_videos_to_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     
     # Check if user is the course instructor
-    if course.instructor != request.user:
+    if not course_access(request).can_manage(course.id):
         messages.error(request, 'You do not have permission to add videos to this course.')
-        return redirect('watch_video')
+        return redirect('dashboard')
     
     if request.method == 'POST':
         video_formset = VideoFormSet(request.POST, request.FILES, queryset=Video.objects.none())
@@ -555,4 +745,99 @@ def add_videos_to_course(request, course_id):
         'course': course,
         'video_formset': video_formset,
     }
-    return render(request, 'courses/add_videos.html', context)
\ No newline at end of file
+    return render(request, 'courses/add_videos.html', context)
+
+
+def _upload_status(upload):
+    return {
+        'url': reverse('video_upload', args=[upload.id]),
+        'offset': upload.offset,
+        'size': upload.size,
+        'video_id': upload.video_id,
+    }
+
+
+def _upload_headers(response, upload):
+    response['Upload-Offset'] = str(upload.offset)
+    response['Upload-Length'] = str(upload.size)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@login_required
+def create_video_upload(request, course_id):
+    """
+    Start a resumable upload of a new video for a course (instructor only).
+    POST title, description, filename and size; answers 201 with the upload
+    URL in Location, where the file is then sent in PATCH chunks.
+    """
+    course = get_object_or_404(Course, id=course_id)
+    
+    # Check if user is the course instructor
+    if not course_access(request).can_manage(course.id):
+        return JsonResponse({'error': 'You do not have permission to add videos to this course.'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    title = request.POST.get('title', '').strip()
+    if not title:
+        return JsonResponse({'error': 'A title is required'}, status=400)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid size'}, status=400)
+    
+    try:
+        upload = create_upload(
+            course, request.user, title, request.POST.get('description', ''),
+            request.POST.get('filename', ''), size,
+        )
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    
+    response = JsonResponse(_upload_status(upload), status=201)
+    response['Location'] = reverse('video_upload', args=[upload.id])
+    return _upload_headers(response, upload)
+
+
+@login_required
+def video_upload(request, upload_id):
+    """
+    tus-style resumable upload resource:
+    HEAD/GET report the offset to resume from, PATCH appends the chunk in
+    the body at Upload-Offset (optionally verified by Upload-Checksum), and
+    DELETE abandons the upload. The Video is created with the last chunk.
+    """
+    upload = get_object_or_404(VideoUpload, id=upload_id, user=request.user)
+    if not course_access(request).can_manage(upload.course_id):
+        raise Http404("Upload not found")
+    
+    try:
+        if request.method == 'PATCH':
+            if request.content_type != 'application/offset+octet-stream':
+                return JsonResponse({'error': 'Content-Type must be application/offset+octet-stream'}, status=415)
+            try:
+                offset = int(request.headers['Upload-Offset'])
+                length = int(request.headers['Content-Length'])
+            except (KeyError, ValueError):
+                return _upload_headers(JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400), upload)
+            
+            # Chunks are read straight from the request stream, never spooled
+            append_chunk(upload, request, offset, length, parse_checksum(request.headers.get('Upload-Checksum')))
+            response = HttpResponse(status=204)
+        elif request.method == 'DELETE':
+            discard_upload(upload)
+            return HttpResponse(status=204)
+        elif request.method in ('GET', 'HEAD'):
+            response = JsonResponse(_upload_status(upload))
+        else:
+            return JsonResponse({'error': 'Method not allowed'}, status=405)
+    except UploadError as exc:
+        upload.refresh_from_db()
+        response = JsonResponse({'error': str(exc)}, status=exc.status)
+        if exc.status == CHECKSUM_MISMATCH:
+            response.reason_phrase = 'Checksum Mismatch'
+    
+    return _upload_headers(response, upload)
+